@@ -0,0 +1,37 @@
+"""
+Per-message decode cost: pydantic `Msg` vs `decode_fast`.
+
+    python benchmarks/bench_decode.py [iterations]
+"""
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from byfoxlib.decode import _loads, decode_fast, decode_model  # noqa: E402
+
+PAYLOAD = json.dumps({
+    "value": ["", "nameless tee", "gg wp, see you next round"],
+    "args": {"server_name": "DDNet RUS", "message_thread_id": 42}
+}).encode()
+
+
+def main(number: int) -> None:
+    fast, model = decode_fast(PAYLOAD), decode_model(PAYLOAD)
+    assert (fast.value, fast.args.server_name, fast.args.message_thread_id) == \
+           (model.value, model.args.server_name, model.args.message_thread_id)
+
+    print(f"loads: {_loads.__module__}, {number} messages")
+    results = {}
+    for name, func in (("pydantic", decode_model), ("fast", decode_fast)):
+        seconds = min(timeit.repeat(lambda f=func: f(PAYLOAD), number=number, repeat=5))
+        results[name] = seconds / number * 1e6
+        print(f"{name:>10}: {results[name]:.2f} us/msg")
+    print(f"{'saved':>10}: {results['pydantic'] - results['fast']:.2f} us/msg "
+          f"({results['pydantic'] / results['fast']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,74 @@
+"""
+`text_replace` against single-pass escapers, for single strings and batches.
+
+    python benchmarks/bench_escape.py [iterations]
+
+Every candidate must give exactly what `text_replace` gives; the fastest one is
+what `text_replace` should be.
+"""
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from byfoxlib.util import text_replace, text_replace_many  # noqa: E402
+
+ESCAPES = {"\\": "\\\\", "'": "\\'", '"': '\\"', "\n": " "}
+TABLE = str.maketrans(ESCAPES)
+PATTERN = re.compile(r"[\\'\"\n]")
+SEP = "\x00"
+
+SAMPLES = {
+    "plain": "gg wp, see you next round",
+    "quoted": 'he said "hi", it\'s \\o/\nreally',
+    "cyrillic": "привет всем, кто со мной на 'карту'?",
+    "long": "lorem ipsum dolor sit amet " * 40 + '"'
+}
+
+
+def translate(msg: str) -> str:
+    return msg.translate(TABLE)
+
+
+def regex(msg: str) -> str:
+    return PATTERN.sub(lambda m: ESCAPES[m.group()], msg)
+
+
+def translate_many(texts: list[str]) -> list[str]:
+    return [text.translate(TABLE) for text in texts]
+
+
+def joined(texts: list[str]) -> list[str]:
+    """Escapes the whole batch as one string."""
+    text = SEP.join(texts)
+    if text.count(SEP) != len(texts) - 1:
+        return text_replace_many(texts)
+    return text_replace(text).split(SEP)
+
+
+def per_call(func, arg, number: int) -> float:
+    return min(timeit.repeat(lambda: func(arg), number=number, repeat=5)) / number * 1e9
+
+
+def main(number: int) -> None:
+    print(f"single strings, ns per call ({number} calls)")
+    for name, sample in SAMPLES.items():
+        expected = text_replace(sample)
+        results = []
+        for func in (text_replace, translate, regex):
+            assert func(sample) == expected, func.__name__
+            results.append(f"{func.__name__} {per_call(func, sample, number):.0f}")
+        print(f"{name:>10}: {', '.join(results)}")
+
+    batch = list(SAMPLES.values()) * 8
+    expected = [text_replace(sample) for sample in batch]
+    print(f"batch of {len(batch)}, ns per string")
+    for func in (text_replace_many, joined, translate_many):
+        assert func(batch) == expected, func.__name__
+        print(f"{func.__name__:>17}: {per_call(func, batch, number // len(batch)) / len(batch):.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,48 @@
+"""
+Per-step cost of the Telegram -> game pipelines.
+
+    python benchmarks/bench_pipeline.py [iterations]
+"""
+import json
+import sys
+import timeit
+from pathlib import Path
+
+import telebot
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from byfoxlib import Config, build_pipelines  # noqa: E402
+
+USER = {"id": 1, "is_bot": False, "first_name": "nameless", "last_name": "tee"}
+BASE = {"message_id": 7, "date": 0, "chat": {"id": -100, "type": "supergroup"}, "from": USER}
+STICKER = {
+    "file_id": "a", "file_unique_id": "b", "type": "regular", "width": 512, "height": 512,
+    "is_animated": False, "is_video": False, "emoji": "\U0001F600"
+}
+MESSAGES = {
+    "text": {**BASE, "text": "gg wp \U0001F44D, see \"you\" next round",
+             "reply_to_message": {**BASE, "message_id": 3, "text": "who's up for a 'race'?"}},
+    "media": {**BASE, "sticker": STICKER},
+    "edit": {**BASE, "text": "gg wp, see you next round", "edit_date": 1}
+}
+
+
+def main(number: int) -> None:
+    pipelines = build_pipelines(Config(nats={"paths": []}))
+    print(f"{number} messages")
+    for name, pipeline in pipelines.items():
+        message = telebot.types.Message.de_json(json.dumps(MESSAGES[name]))
+        parts = [part for part in (step(message) for step in pipeline.steps) if part is not None]
+        timings = [(step.__name__, step) for step in pipeline.steps]
+        timings.append(("render", lambda _, p=parts, render=pipeline.render: render(p)))
+        timings.append(("total", pipeline))
+
+        print(f"{name}: {pipeline(message)}")
+        for label, func in timings:
+            seconds = min(timeit.repeat(lambda f=func, m=message: f(m), number=number, repeat=5))
+            print(f"{label:>10}: {seconds / number * 1e6:.2f} us/msg")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
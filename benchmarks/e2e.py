@@ -0,0 +1,334 @@
+"""
+End-to-end throughput and latency of the game -> Telegram path.
+
+Starts a fake Telegram Bot API on localhost and, when a `nats-server` binary is
+found (--nats-server, $NATS_SERVER or PATH), a throwaway `nats-server -js`;
+main.py then runs unchanged against both. Without the binary, or with
+--in-process, game lines are handed straight to `main.handle_message` as
+stand-in JetStream messages. With --workers main.py runs as its own supervised
+process tree instead. Nothing leaves the machine.
+
+    python benchmarks/e2e.py [--paths 4] [--servers 8] [--rate 2000] [--duration 10] [--workers 1]
+
+Every game line carries its publish time, so the fake API can tell the end-to-end
+latency of each line it receives. Peak RSS is that of this process (bridge,
+publisher and fake API), or of the largest worker with --workers; the
+nats-server runs separately.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+import resource
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import yaml
+from aiohttp import web
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+LINE = re.compile(r"^b(\d+): (\d+)$", re.MULTILINE)
+
+
+class FakeTelegram:
+    """Answers the Bot API methods the bridge uses and timestamps every game line it receives."""
+
+    def __init__(self) -> None:
+        self.calls: dict[str, int] = {}
+        self.latencies: dict[int, int] = {}
+        self.last_ns = 0
+        self.polling = asyncio.Event()
+        self._ids = itertools.count(1)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getMe":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"})
+        if method == "getUpdates":
+            self.polling.set()
+            await asyncio.sleep(min(float(data.get("timeout", 1)), 1))
+            return self._ok([])
+        if method not in ("sendMessage", "editMessageText"):
+            return self._ok(True)
+
+        now = time.perf_counter_ns()
+        text = data["text"]
+        for seq, sent in LINE.findall(text):
+            # edits repeat the lines already shown, only the first sighting counts
+            self.latencies.setdefault(int(seq), now - int(sent))
+        self.last_ns = now
+        message_id = int(data["message_id"]) if method == "editMessageText" else next(self._ids)
+        return self._ok({"message_id": message_id, "date": 0, "chat": {"id": 1, "type": "supergroup"}, "text": text})
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, port: int) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        return runner
+
+
+class StandInMsg:
+    """Just enough of a JetStream message for `main.handle_message`."""
+
+    def __init__(self, subject: str, data: bytes, seq: int) -> None:
+        self.subject = subject
+        self.data = data
+        self.metadata = SimpleNamespace(stream="tw", sequence=SimpleNamespace(stream=seq))
+
+    async def ack(self) -> None:
+        pass
+
+    async def nak(self, delay: float | None = None) -> None:
+        pass
+
+    async def in_progress(self) -> None:
+        pass
+
+    async def term(self) -> None:
+        pass
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_config(directory: Path, args: argparse.Namespace, nats_port: int, api_port: int) -> None:
+    paths = [
+        {"chat_id": -1000 - p, "read": f"tw.bench{p}.*", "tokens": [f"{p % args.tokens + 1}:bench"]}
+        for p in range(args.paths)
+    ]
+    unlimited = 1_000_000
+    config = {
+        "log_level": "warning",
+        "workers": args.workers,
+        "nats": {
+            "server": f"nats://127.0.0.1:{nats_port}",
+            "fast_decode": args.fast_decode,
+            "pull_batch": args.pull_batch,
+            "paths": paths
+        },
+        "telegram": {
+            "flush_window": args.flush_window,
+            "edit_mode": args.edit_mode,
+            "api_url": f"http://127.0.0.1:{api_port}/bot{{0}}/{{1}}",
+            "token_rate": 30 if args.limits else unlimited,
+            "token_burst": 30 if args.limits else unlimited,
+            "chat_rate": 20 if args.limits else unlimited,
+            "chat_burst": 5 if args.limits else unlimited
+        }
+    }
+    (directory / "config.yaml").write_text(yaml.safe_dump(config), encoding="utf-8")
+
+
+def subjects(args: argparse.Namespace) -> list[tuple[str, int]]:
+    return [(f"tw.bench{p}.srv{s}", s + 1) for p in range(args.paths) for s in range(args.servers)]
+
+
+def payload(seq: int, thread_id: int) -> bytes:
+    return json.dumps({
+        "value": ["", f"b{seq}", str(time.perf_counter_ns())],
+        "args": {"server_name": f"srv{thread_id}", "message_thread_id": thread_id}
+    }).encode()
+
+
+async def publish(send, args: argparse.Namespace) -> int:
+    """Publishes round-robin over all subjects at `args.rate` lines per second; returns the number sent."""
+    targets = itertools.cycle(subjects(args))
+    sent = 0
+    start = time.monotonic()
+    while (elapsed := time.monotonic() - start) < args.duration:
+        due = int(elapsed * args.rate) + 1
+        while sent < due:
+            subject, thread_id = next(targets)
+            await send(subject, payload(sent, thread_id))
+            sent += 1
+        await asyncio.sleep(0.001)
+    return sent
+
+
+async def wait_delivered(fake: FakeTelegram, sent: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while len(fake.latencies) < sent and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def run_nats(main, fake: FakeTelegram, args: argparse.Namespace, port: int) -> tuple[int, int]:
+    import nats
+
+    task = asyncio.create_task(main.main())
+    await asyncio.wait_for(fake.polling.wait(), 30)
+
+    nc = await nats.connect(f"nats://127.0.0.1:{port}")
+    try:
+        start = time.perf_counter_ns()
+        sent = await publish(nc.publish, args)
+        await nc.flush()
+        await wait_delivered(fake, sent, args.drain)
+    finally:
+        await nc.close()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return sent, start
+
+
+async def run_workers(fake: FakeTelegram, args: argparse.Namespace, port: int, directory: Path) -> tuple[int, int]:
+    import nats
+
+    supervisor = subprocess.Popen([sys.executable, str(ROOT / "main.py")], cwd=directory)
+    nc = None
+    try:
+        await asyncio.wait_for(fake.polling.wait(), 30)
+        nc = await nats.connect(f"nats://127.0.0.1:{port}")
+        start = time.perf_counter_ns()
+        sent = await publish(nc.publish, args)
+        await nc.flush()
+        await wait_delivered(fake, sent, args.drain)
+    finally:
+        if nc is not None:
+            await nc.close()
+        supervisor.send_signal(signal.SIGINT)
+        await asyncio.to_thread(supervisor.wait)
+    return sent, start
+
+
+async def run_in_process(main, fake: FakeTelegram, args: argparse.Namespace) -> tuple[int, int]:
+    from byfoxlib import Nats
+
+    main.nats = Nats((None, None))
+    main.setup_pipeline()
+    seq = itertools.count(1)
+
+    async def send(subject: str, data: bytes) -> None:
+        await main.handle_message(StandInMsg(subject, data, next(seq)))
+
+    try:
+        start = time.perf_counter_ns()
+        sent = await publish(send, args)
+        await wait_delivered(fake, sent, args.drain)
+    finally:
+        await main.scheduler.close()
+        await main.dispatcher.close()
+        await main.acks.close()
+        await main.session_manager.close()
+    return sent, start
+
+
+def start_nats_server(binary: str, port: int, store: Path) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [binary, "-js", "-a", "127.0.0.1", "-p", str(port), "-sd", str(store)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError(f"{binary} did not start listening on port {port}")
+
+
+def percentile(values: list[int], q: float) -> float:
+    return values[round(q * (len(values) - 1))] / 1e6 if values else float("nan")
+
+
+def report(fake: FakeTelegram, sent: int, start_ns: int, backend: str, workers: int) -> None:
+    delivered = len(fake.latencies)
+    latencies = sorted(fake.latencies.values())
+    seconds = (fake.last_ns - start_ns) / 1e9 if delivered else float("nan")
+    calls = fake.calls.get("sendMessage", 0) + fake.calls.get("editMessageText", 0)
+
+    print(f"backend:          {backend}")
+    print(f"lines:            {delivered}/{sent} delivered")
+    print(f"throughput:       {delivered / seconds:.0f} msgs/s")
+    print(f"latency p50/p99:  {percentile(latencies, 0.5):.1f} / {percentile(latencies, 0.99):.1f} ms")
+    print(f"telegram calls:   {calls} ({calls / delivered if delivered else float('nan'):.3f} per line)")
+    if workers > 1:
+        rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        print(f"peak RSS:         {rss / 1024:.1f} MiB (largest of {workers} workers)")
+    else:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"peak RSS:         {rss / 1024:.1f} MiB")
+
+
+async def run(args: argparse.Namespace) -> None:
+    binary = None
+    if not args.in_process:
+        binary = args.nats_server or os.environ.get("NATS_SERVER") or shutil.which("nats-server")
+    if args.workers > 1 and binary is None:
+        raise SystemExit("--workers needs a nats-server binary")
+
+    with tempfile.TemporaryDirectory(prefix="tw-e2e-") as tmp:
+        directory = Path(tmp)
+        nats_port, api_port = free_port(), free_port()
+        write_config(directory, args, nats_port, api_port)
+
+        server = start_nats_server(binary, nats_port, directory / "jetstream") if binary else None
+        fake = FakeTelegram()
+        runner = await fake.start(api_port)
+
+        try:
+            if args.workers > 1:
+                sent, start = await run_workers(fake, args, nats_port, directory)
+            else:
+                # main.py reads ./config.yaml and builds the bots at import time
+                os.chdir(directory)
+                import main
+
+                if server is not None:
+                    sent, start = await run_nats(main, fake, args, nats_port)
+                else:
+                    sent, start = await run_in_process(main, fake, args)
+        finally:
+            await runner.cleanup()
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    report(fake, sent, start, f"nats-server ({binary})" if binary else "in-process stand-in", args.workers)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--paths", type=int, default=4, help="configured paths, one chat each")
+    parser.add_argument("--servers", type=int, default=8, help="game servers (threads) publishing per path")
+    parser.add_argument("--rate", type=float, default=2000, help="game lines per second, over all subjects")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to publish for")
+    parser.add_argument("--drain", type=float, default=30, help="seconds to wait for the last lines")
+    parser.add_argument("--tokens", type=int, default=1, help="distinct bot tokens shared by the paths")
+    parser.add_argument("--flush-window", type=float, default=0.3)
+    parser.add_argument("--pull-batch", type=int, default=0, help="use pull consumers with this batch size")
+    parser.add_argument("--fast-decode", action="store_true")
+    parser.add_argument("--edit-mode", action="store_true")
+    parser.add_argument("--limits", action="store_true", help="keep the default Telegram rate limits")
+    parser.add_argument("--nats-server", help="nats-server binary, defaults to $NATS_SERVER or PATH")
+    parser.add_argument("--in-process", action="store_true", help="skip nats-server even if it is available")
+    parser.add_argument("--workers", type=int, default=1, help="run main.py as a supervisor with this many workers")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
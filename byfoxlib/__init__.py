@@ -1,6 +1,24 @@
-from .bot import Bot
+from .ack import AckTracker
+from .append import ThreadAppender
+from .bot import Bot, SendResult, SendStatus
+from .chunk import TELEGRAM_LIMIT, ChunkBuilder, utf16_len
+from .dedupe import SequenceDedupe, sequence_key
+from .decode import FastArgs, FastMsg, decode_fast, decode_model
+from .dispatcher import Dispatcher
 from .emojies import replace_from_emoji, replace_from_str
+from .formatter import Formatter, compile_pattern
+from .http import SessionManager, install_session_manager
 from .message import Message
+from .metrics import REGISTRY, Counter, Gauge, Histogram, Registry, Summary, start_metrics_server, \
+    watch_loop_lag
 from .model import *
-from .util import Nats, get_config, nats_connect, format_mention, text_format, \
-    regex_format, generate_message_reply, generate_message, check_media
+from .pipeline import Pipeline, Step, build_pipelines
+from .pool import TokenPool
+from .publish import Publisher
+from .ratelimit import RateLimiter, TokenBucket
+from .router import Router
+from .scheduler import Batch, FlushScheduler
+from .shard import WORKER_ENV, HashRing, supervise, worker_index
+from .tracing import TRACER, JsonLinesSink, OpenTelemetrySink, RingBufferSink, Tracer
+from .util import Nats, get_config, nats_connect, nats_msg_id, format_mention, text_format, \
+    regex_format, generate_message_reply, generate_message, check_media, text_replace, text_replace_many
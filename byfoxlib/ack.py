@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from collections.abc import Hashable, Iterable
+
+from nats.aio.msg import Msg as MsgNats
+
+from .dedupe import sequence_key
+
+_log = logging.getLogger(__name__)
+
+__all__ = ("AckTracker",)
+
+
+class AckTracker:
+    """
+    Explicit delivery bookkeeping for JetStream messages.
+
+    `track` takes one of `max_pending` slots, so at most that many messages are held
+    between delivery and ack, and waits while none is free. Tracked messages, and those
+    waiting for a slot, get an `in_progress` heartbeat every `heartbeat` seconds, so a
+    long wait for Telegram does not run into the consumer's ack_wait. `ack`, `nak` and `term` settle messages and
+    free their slots; `release` frees them without telling the server anything.
+    `holds` tells how many copies of a stream sequence are tracked, since JetStream
+    settles a message by its sequence whichever delivery the ack comes from.
+    """
+
+    def __init__(self, max_pending: int = 1000, heartbeat: float = 10, nak_delay: float = 5) -> None:
+        self.heartbeat = heartbeat
+        self.nak_delay = nak_delay
+        self._slots = asyncio.Semaphore(max_pending)
+        self._pending: dict[int, MsgNats] = {}
+        self._waiting: dict[int, MsgNats] = {}
+        self._sequences: dict[Hashable, int] = {}
+        self._task: asyncio.Task | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def track(self, message: MsgNats) -> None:
+        # a message waiting for a slot is already held by the server, so it gets heartbeats too
+        self._waiting[id(message)] = message
+        if self._task is None:
+            self._task = asyncio.create_task(self._beat())
+        try:
+            await self._slots.acquire()
+        finally:
+            del self._waiting[id(message)]
+        self._pending[id(message)] = message
+        key = sequence_key(message)
+        self._sequences[key] = self._sequences.get(key, 0) + 1
+
+    async def ack(self, messages: Iterable[MsgNats]) -> None:
+        await self._settle(messages, lambda message: message.ack())
+
+    async def nak(self, messages: Iterable[MsgNats], delay: float | None = None) -> None:
+        delay = self.nak_delay if delay is None else delay
+        await self._settle(messages, lambda message: message.nak(delay))
+
+    async def term(self, messages: Iterable[MsgNats]) -> None:
+        await self._settle(messages, lambda message: message.term())
+
+    def holds(self, key: Hashable) -> int:
+        return self._sequences.get(key, 0)
+
+    async def release(self, messages: Iterable[MsgNats]) -> None:
+        await self._settle(messages, None)
+
+    async def _settle(self, messages: Iterable[MsgNats], action) -> None:
+        messages = [message for message in messages if self._pending.pop(id(message), None) is not None]
+        for message in messages:
+            self._slots.release()
+            key = sequence_key(message)
+            if self._sequences[key] > 1:
+                self._sequences[key] -= 1
+            else:
+                del self._sequences[key]
+        if action is None:
+            return
+        for result in await asyncio.gather(*map(action, messages), return_exceptions=True):
+            if isinstance(result, Exception):
+                _log.warning("failed to settle message: %r", result)
+
+    async def _beat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            if self._pending or self._waiting:
+                await asyncio.gather(
+                    *(message.in_progress() for message in [*self._pending.values(), *self._waiting.values()]),
+                    return_exceptions=True
+                )
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
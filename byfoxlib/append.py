@@ -0,0 +1,59 @@
+import logging
+import time
+
+from .bot import Bot, SendResult, SendStatus
+from .chunk import TELEGRAM_LIMIT, utf16_len
+from .pool import TokenPool
+
+_log = logging.getLogger(__name__)
+
+__all__ = ("ThreadAppender",)
+
+
+class _Tail:
+    __slots__ = ("bot", "message_id", "text", "length", "sent_at")
+
+    def __init__(self, bot: Bot, message_id: int, text: str) -> None:
+        self.bot = bot
+        self.message_id = message_id
+        self.text = text
+        self.length = utf16_len(text)
+        self.sent_at = time.monotonic()
+
+
+class ThreadAppender:
+    """
+    Edit-in-place delivery for live chat threads.
+
+    New text is appended to the last message the bridge sent to a (chat_id, thread_id)
+    with editMessageText, as long as that message is younger than `window` seconds and
+    the result stays within `limit` UTF-16 units. Otherwise, or when the edit is
+    rejected, a new message is sent and becomes the thread's tail.
+    """
+
+    def __init__(self, window: float = 60, limit: int = TELEGRAM_LIMIT) -> None:
+        self.window = window
+        self.limit = limit
+        self._tails: dict[tuple[int | str, int | None], _Tail] = {}
+
+    async def send(self, pool: TokenPool, text: str, chat_id: int | str, thread_id: int | None) -> SendResult:
+        key = (chat_id, thread_id)
+        tail = self._tails.get(key)
+        if tail is not None and time.monotonic() - tail.sent_at < self.window \
+                and tail.length + 1 + utf16_len(text) <= self.limit:
+            combined = f"{tail.text}\n{text}"
+            result = await tail.bot.edit_msg_telegram(combined, chat_id, tail.message_id)
+            if result:
+                tail.text = combined
+                tail.length = utf16_len(combined)
+                return result
+            if result.status is SendStatus.FAILED:
+                return result
+            _log.debug("append to message %s in chat %s failed: %s", tail.message_id, chat_id, result)
+
+        result = await pool.send(text, chat_id, thread_id)
+        if result and result.message is not None:
+            self._tails[key] = _Tail(result.bot, result.message.message_id, text)
+        else:
+            self._tails.pop(key, None)
+        return result
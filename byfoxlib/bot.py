@@ -1,28 +1,132 @@
+import asyncio
 import logging
+import random
+import time
+from enum import Enum
 
+import aiohttp
+import telebot.types
 from telebot.async_telebot import AsyncTeleBot
-from telebot.asyncio_helper import ApiTelegramException
+from telebot.asyncio_helper import ApiTelegramException, ApiHTTPException, ApiInvalidJSONException, RequestTimeout
+
+from .metrics import TELEGRAM_ERRORS, TELEGRAM_LATENCY, TELEGRAM_REQUESTS
+from .ratelimit import RateLimiter
 
 log = logging.getLogger(__name__)
 
 
+class SendStatus(Enum):
+    OK = "ok"
+    # transient error (5xx, network, timeout) that outlived every retry
+    FAILED = "failed"
+    # 401/403: the token was revoked or the bot lost access to the chat
+    FORBIDDEN = "forbidden"
+    # any other Telegram error, sending the same request again will not help
+    REJECTED = "rejected"
+
+
+class SendResult:
+    __slots__ = ("status", "message", "error", "bot")
+
+    def __init__(
+            self,
+            status: SendStatus,
+            message: telebot.types.Message | None = None,
+            error: Exception | None = None,
+            bot: "Bot | None" = None
+    ) -> None:
+        self.status = status
+        self.message = message
+        self.error = error
+        self.bot = bot
+
+    def __bool__(self) -> bool:
+        return self.status is SendStatus.OK
+
+    def __repr__(self) -> str:
+        return f"SendResult({self.status.name}, error={self.error!r})"
+
+
 class Bot(AsyncTeleBot):
-    def __init__(self, token: str, *args, **kwargs):
+    def __init__(
+            self,
+            token: str,
+            *args,
+            rate_limiter: RateLimiter | None = None,
+            max_retries: int = 3,
+            backoff_base: float = 0.5,
+            backoff_max: float = 10,
+            **kwargs
+    ):
         super().__init__(token, *args, **kwargs)
+        self.bot_id = token.split(":")[0]
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
         g = globals()
         if g.get("bots") is None:
             g["bots"] = {}
 
         g["bots"][token] = self
 
-    async def send_msg_telegram(self, text: str, chat_id: int | str, thread_id: int | None) -> bool:
-        try:
-            await self.send_message(chat_id, text, message_thread_id=thread_id)
-        except ApiTelegramException as err:
-            logging.debug("ApiTelegramException occurred: %s", err)
-        else:
-            return True
-        return False
+    async def send_msg_telegram(self, text: str, chat_id: int | str, thread_id: int | None) -> SendResult:
+        return await self._request(chat_id, self.send_message, chat_id, text, message_thread_id=thread_id)
+
+    async def edit_msg_telegram(self, text: str, chat_id: int | str, message_id: int) -> SendResult:
+        return await self._request(chat_id, self.edit_message_text, text, chat_id, message_id)
+
+    async def _request(self, chat_id: int | str, method, *args, **kwargs) -> SendResult:
+        result = await self._attempts(chat_id, method, *args, **kwargs)
+        TELEGRAM_REQUESTS.inc(self.bot_id, chat_id, method.__name__, result.status.value)
+        return result
+
+    async def _attempts(self, chat_id: int | str, method, *args, **kwargs) -> SendResult:
+        """
+        Calls a Telegram method, retrying what can be retried.
+
+        A 429 pauses this bot's lane for the chat for `retry_after` seconds and tries again;
+        5xx and network errors are retried with full-jitter exponential backoff.
+        Up to `max_retries` retries are made, 429s included.
+        """
+        error = None
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire(chat_id)
+            start = time.perf_counter()
+            try:
+                message = await method(*args, **kwargs)
+            except ApiTelegramException as err:
+                error = err
+                TELEGRAM_ERRORS.inc(self.bot_id, err.error_code)
+                if err.error_code == 429:
+                    retry_after = (err.result_json.get("parameters") or {}).get("retry_after", 1)
+                    log.warning("flood control in chat %s, retry after %ss", chat_id, retry_after)
+                    self.rate_limiter.pause(chat_id, retry_after)
+                    continue
+                if err.error_code in (401, 403):
+                    log.error("bot can no longer send to chat %s: %s", chat_id, err.description)
+                    return SendResult(SendStatus.FORBIDDEN, error=err, bot=self)
+                if err.error_code < 500:
+                    log.warning("telegram rejected request to chat %s: %s", chat_id, err.description)
+                    return SendResult(SendStatus.REJECTED, error=err, bot=self)
+            except ApiHTTPException as err:
+                error = err
+                TELEGRAM_ERRORS.inc(self.bot_id, err.result.status)
+                if err.result.status < 500:
+                    log.warning("telegram rejected request to chat %s: HTTP %s", chat_id, err.result.status)
+                    return SendResult(SendStatus.REJECTED, error=err, bot=self)
+            except (TimeoutError, ApiInvalidJSONException, RequestTimeout, aiohttp.ClientError) as err:
+                error = err
+                TELEGRAM_ERRORS.inc(self.bot_id, "network")
+            else:
+                return SendResult(SendStatus.OK, message, bot=self)
+            finally:
+                TELEGRAM_LATENCY.observe(time.perf_counter() - start, method.__name__)
+
+            log.debug("request to chat %s failed (try #%s): %s", chat_id, attempt + 1, error)
+            if attempt < self.max_retries:
+                await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+        return SendResult(SendStatus.FAILED, error=error, bot=self)
 
     @staticmethod
     def get_tokens() -> dict[str, "Bot"] | None:
@@ -0,0 +1,90 @@
+from collections.abc import Iterable
+
+__all__ = ("TELEGRAM_LIMIT", "ChunkBuilder", "utf16_len")
+
+TELEGRAM_LIMIT = 4096
+
+
+def utf16_len(text: str) -> int:
+    """Length in UTF-16 code units, which is how Telegram measures message text."""
+    return len(text.encode("utf-16-le")) >> 1
+
+
+class ChunkBuilder:
+    """
+    Packs lines into as few Telegram messages as possible.
+
+    Lines are kept in a list together with the running UTF-16 length of the open chunk.
+    A chunk is closed only at a line boundary, when the next line would push it past
+    `limit`. A single line longer than `limit` is split on its own, without cutting a
+    surrogate pair. `marked` tells, for every chunk, how many lines are complete once it
+    has been sent, so a partly delivered batch can settle exactly those.
+    """
+
+    def __init__(self, limit: int = TELEGRAM_LIMIT) -> None:
+        self.limit = limit
+        self._chunks: list[str] = []
+        self._ends: list[int] = []
+        self._lines: list[str] = []
+        self._length = 0
+        self._count = 0
+
+    @classmethod
+    def build(cls, lines: Iterable[str], limit: int = TELEGRAM_LIMIT) -> list[str]:
+        return [chunk for chunk, _ in cls.build_marked(lines, limit)]
+
+    @classmethod
+    def build_marked(cls, lines: Iterable[str], limit: int = TELEGRAM_LIMIT) -> list[tuple[str, int]]:
+        builder = cls(limit)
+        for line in lines:
+            builder.add(line)
+        return builder.marked()
+
+    def add(self, line: str) -> None:
+        length = utf16_len(line)
+        if length > self.limit:
+            self._close()
+            parts = self._split(line)
+            self._chunks.extend(parts)
+            # the line is complete only with its last part
+            self._ends.extend([self._count] * (len(parts) - 1))
+            self._count += 1
+            self._ends.append(self._count)
+            return
+
+        added = length + 1 if self._lines else length
+        if self._length + added > self.limit:
+            self._close()
+            added = length
+        self._lines.append(line)
+        self._length += added
+        self._count += 1
+
+    def chunks(self) -> list[str]:
+        return [chunk for chunk, _ in self.marked()]
+
+    def marked(self) -> list[tuple[str, int]]:
+        """The chunks, each with the number of added lines that are complete once it has been sent."""
+        self._close()
+        marked = list(zip(self._chunks, self._ends, strict=True))
+        self._chunks, self._ends = [], []
+        return marked
+
+    def _close(self) -> None:
+        if self._lines:
+            self._chunks.append("\n".join(self._lines))
+            self._ends.append(self._count)
+            self._lines = []
+            self._length = 0
+
+    def _split(self, line: str) -> list[str]:
+        parts = []
+        start = length = 0
+        for i, char in enumerate(line):
+            size = 2 if ord(char) > 0xFFFF else 1
+            if length + size > self.limit:
+                parts.append(line[start:i])
+                start, length = i, 0
+            length += size
+        parts.append(line[start:])
+        return parts
@@ -0,0 +1,59 @@
+import json
+
+from .model import Msg
+
+try:
+    from orjson import loads as _loads
+except ImportError:  # orjson is optional, json.loads takes bytes as well
+    _loads = json.loads
+
+__all__ = ("FastArgs", "FastMsg", "decode_fast", "decode_model")
+
+
+class FastArgs:
+    __slots__ = ("server_name", "message_thread_id")
+
+    def __init__(self, server_name: str | None, message_thread_id: int | None) -> None:
+        self.server_name = server_name
+        self.message_thread_id = message_thread_id
+
+
+class FastMsg:
+    """Same `value`/`args` shape as the pydantic `Msg`, without the validation machinery."""
+    __slots__ = ("value", "args")
+
+    def __init__(self, value: list, args: FastArgs) -> None:
+        self.value = value
+        self.args = args
+
+
+def decode_model(data: bytes) -> Msg:
+    return Msg(**json.loads(data.decode()))
+
+
+def decode_fast(data: bytes) -> FastMsg:
+    """
+    Decodes a game line envelope straight from the NATS payload.
+
+    Uses orjson when it is installed. Only the checks that matter for routing are made:
+    `value` must be a list, `server_name` a string or null and `message_thread_id`
+    an integer (numeric strings are accepted, like pydantic does) or null.
+    """
+    raw = _loads(data)
+    try:
+        value = raw["value"]
+        args = raw["args"]
+        server_name = args["server_name"]
+        thread_id = args["message_thread_id"]
+    except (KeyError, TypeError) as err:
+        raise ValueError(f"malformed message envelope: {err!r}") from None
+
+    if not isinstance(value, list):
+        raise ValueError("'value' must be a list")
+    if server_name is not None and not isinstance(server_name, str):
+        raise ValueError("'server_name' must be a string")
+    if thread_id is not None and not isinstance(thread_id, int):
+        if not isinstance(thread_id, str) or not thread_id.lstrip("-").isdigit():
+            raise ValueError("'message_thread_id' must be an integer")
+        thread_id = int(thread_id)
+    return FastMsg(value, FastArgs(server_name, thread_id))
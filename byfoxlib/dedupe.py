@@ -0,0 +1,50 @@
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+
+from nats.aio.msg import Msg as MsgNats
+
+__all__ = ("SequenceDedupe", "sequence_key")
+
+
+def sequence_key(message: MsgNats) -> tuple[str, int]:
+    """Identifies a JetStream message across redeliveries: stream name and stream sequence."""
+    metadata = message.metadata
+    return metadata.stream, metadata.sequence.stream
+
+
+class SequenceDedupe:
+    """
+    Bounded LRU/TTL set of already seen message keys.
+
+    Holds at most `maxsize` keys, each for `ttl` seconds. `seen` records a key and
+    reports whether it was already there; the number of duplicates is kept in `dropped`.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 600) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.dropped = 0
+        self._seen: OrderedDict[Hashable, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def seen(self, key: Hashable) -> bool:
+        now = time.monotonic()
+        seen = self._seen
+        while seen:
+            oldest, expires = next(iter(seen.items()))
+            if expires > now and len(seen) < self.maxsize:
+                break
+            del seen[oldest]
+
+        if key in seen:
+            self.dropped += 1
+            return True
+        seen[key] = now + self.ttl
+        return False
+
+    def forget(self, key: Hashable) -> None:
+        """Lets the key through again, e.g. after the message was nak'ed for redelivery."""
+        self._seen.pop(key, None)
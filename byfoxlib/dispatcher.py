@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Awaitable, Callable, Hashable
+
+from .scheduler import Batch
+
+_log = logging.getLogger(__name__)
+
+__all__ = ("Dispatcher",)
+
+
+class Dispatcher:
+    """
+    Delivers batches in parallel across keys and in order within a key.
+
+    Every (chat_id, thread_id) key gets its own queue drained by a single worker,
+    so one slow chat only holds up itself. `submit` queues a batch right away, so
+    batches of a key are delivered exactly in the order they were submitted; the
+    queues are not bounded here, the ack tracker upstream bounds how many messages
+    can be waiting. At most `max_workers` batches are handled at the same time and
+    a worker stops once its queue is empty.
+    """
+
+    def __init__(self, handle: Callable[[Batch], Awaitable[bool]], max_workers: int = 64) -> None:
+        self.handle = handle
+        self._slots = asyncio.Semaphore(max_workers)
+        self._queues: dict[Hashable, deque[Batch]] = {}
+        self._workers: dict[Hashable, asyncio.Task] = {}
+
+    def submit(self, batch: Batch) -> None:
+        queue = self._queues.get(batch.key)
+        if queue is None:
+            queue = self._queues[batch.key] = deque()
+            self._workers[batch.key] = asyncio.create_task(self._work(batch.key, queue))
+        queue.append(batch)
+
+    def depths(self) -> dict[Hashable, int]:
+        """Queued batches per key."""
+        return {key: len(queue) for key, queue in self._queues.items()}
+
+    async def _work(self, key: Hashable, queue: deque[Batch]) -> None:
+        try:
+            while queue:
+                batch = queue[0]
+                async with self._slots:
+                    try:
+                        result = await self.handle(batch)
+                    except Exception:
+                        _log.exception("delivery of %s failed", key)
+                        result = False
+                queue.popleft()
+                if not batch.done.done():
+                    batch.done.set_result(result)
+        finally:
+            del self._queues[key], self._workers[key]
+
+    async def close(self) -> None:
+        """Waits for every queued batch to be handled."""
+        while self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
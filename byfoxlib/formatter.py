@@ -0,0 +1,135 @@
+from collections.abc import Callable, Iterable
+from operator import attrgetter, itemgetter
+from string import Formatter as _StrFormatter
+
+__all__ = ("Formatter", "compile_pattern")
+
+_CONVERSIONS = {"r": repr, "s": str, "a": ascii}
+
+
+def _join(value: list) -> str:
+    return ": ".join(value)
+
+
+class Formatter:
+    """
+    A `Path.pattern` compiled once at config load.
+
+    The pattern is parsed a single time, with the public `string.Formatter`, into a
+    %-template for its literal text and a small function per field, which together
+    produce what `pattern.format(value)` would, so nothing is parsed per message.
+    Without a pattern the values are joined with ": ".
+    """
+    __slots__ = ("pattern", "format")
+
+    def __init__(self, pattern: str | None) -> None:
+        self.pattern = pattern
+        self.format: Callable[[list], str] = _join if pattern is None else _compile(pattern)
+
+    def many(self, values: Iterable[list]) -> list[str]:
+        """Formats a batch of values, e.g. the lines of one coalesced send."""
+        return list(map(self.format, values))
+
+
+def compile_pattern(pattern: str | None) -> Formatter:
+    return Formatter(pattern)
+
+
+class _Access:
+    """Stands in for the argument while `get_field` walks a field name, recording every step."""
+    __slots__ = ("_steps",)
+
+    def __init__(self, steps: tuple = ()) -> None:
+        object.__setattr__(self, "_steps", steps)
+
+    def __getattribute__(self, name: str) -> "_Access":
+        return _Access(object.__getattribute__(self, "_steps") + ((True, name),))
+
+    def __getitem__(self, key) -> "_Access":
+        return _Access(object.__getattribute__(self, "_steps") + ((False, key),))
+
+
+class _Arguments(dict):
+    """Positional and keyword arguments for `get_field`: every name resolves to a fresh `_Access`."""
+
+    def __missing__(self, key) -> _Access:
+        return _Access()
+
+
+def _getter(steps: tuple) -> Callable:
+    steps = tuple(attrgetter(key) if is_attr else itemgetter(key) for is_attr, key in steps)
+    if not steps:
+        return lambda value: value
+    if len(steps) == 1:
+        return steps[0]
+
+    def get(value):
+        for step in steps:
+            value = step(value)
+        return value
+    return get
+
+
+def _compile(pattern: str) -> Callable[[list], str]:
+    parser = _StrFormatter()
+    arguments = _Arguments()
+    template = []
+    fields = []
+    specs = []
+    auto = None
+    for literal, field_name, spec, conversion in parser.parse(pattern):
+        template.append(literal.replace("%", "%%"))
+        if field_name is None:
+            continue
+        if spec and "{" in spec:
+            raise ValueError(f"nested fields are not supported in pattern {pattern!r}")
+
+        access, first = parser.get_field(field_name, arguments, arguments)
+        if first == "":
+            if auto is False:
+                raise ValueError(f"cannot switch from manual to automatic field numbering in {pattern!r}")
+            if auto:
+                raise ValueError(f"pattern {pattern!r} uses '{{}}' more than once, only one argument is passed")
+            auto = True
+        else:
+            if auto:
+                raise ValueError(f"cannot switch from automatic to manual field numbering in {pattern!r}")
+            auto = False
+            if first != 0:
+                raise ValueError(f"pattern {pattern!r} references argument {first!r}, only 0 is passed")
+        if conversion and conversion not in _CONVERSIONS:
+            raise ValueError(f"unknown conversion '!{conversion}' in pattern {pattern!r}")
+
+        steps = object.__getattribute__(access, "_steps")
+        if spec:
+            template.append("%s")
+            specs.append((len(fields), _CONVERSIONS.get(conversion), spec))
+        else:
+            # without a spec, %s, %r and %a give what format(), !r and !a give for plain values
+            template.append(f"%{conversion or 's'}")
+        fields.append(steps)
+
+    template = "".join(template)
+    if not fields:
+        text = template % ()
+        return lambda _: text
+
+    if all(len(steps) == 1 and not steps[0][0] for steps in fields):
+        # the usual "{0[1]}: {0[2]}": one itemgetter picks every field at once
+        pick = itemgetter(*(steps[0][1] for steps in fields))
+        get = (lambda value: (pick(value),)) if len(fields) == 1 else pick
+    else:
+        getters = tuple(map(_getter, fields))
+
+        def get(value) -> tuple:
+            return tuple([getter(value) for getter in getters])
+
+    if not specs:
+        return lambda value: template % get(value)
+
+    def render(value) -> str:
+        values = list(get(value))
+        for i, convert, spec in specs:
+            values[i] = format(values[i] if convert is None else convert(values[i]), spec)
+        return template % tuple(values)
+    return render
@@ -0,0 +1,74 @@
+import logging
+
+import aiohttp
+from telebot import asyncio_helper
+
+_log = logging.getLogger(__name__)
+
+__all__ = ("SessionManager", "install_session_manager")
+
+
+class SessionManager(asyncio_helper.SessionManager):
+    """
+    Tuned replacement for telebot's session manager.
+
+    telebot sends the requests of every AsyncTeleBot through one module-level
+    session manager, so all bots share this connector: keep-alive sockets, the
+    per-host connection limit and the DNS cache. Connection reuse is counted
+    through an aiohttp trace.
+    """
+
+    def __init__(
+            self,
+            limit: int = 100,
+            limit_per_host: int = 50,
+            keepalive_timeout: float = 60,
+            dns_cache_ttl: int = 300
+    ) -> None:
+        super().__init__()
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.created = 0
+        self.reused = 0
+
+    async def create_session(self) -> aiohttp.ClientSession:
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._on_create)
+        trace.on_connection_reuseconn.append(self._on_reuse)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                ssl=self.ssl_context
+            ),
+            trace_configs=[trace]
+        )
+        _log.debug("telegram http session created")
+        return self.session
+
+    async def _on_create(self, *_) -> None:
+        self.created += 1
+
+    async def _on_reuse(self, *_) -> None:
+        self.reused += 1
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Share of requests that went out on an already open connection."""
+        total = self.created + self.reused
+        return self.reused / total if total else 0.0
+
+    async def close(self) -> None:
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+def install_session_manager(manager: SessionManager) -> SessionManager:
+    """Makes every bot in this process send through `manager`."""
+    asyncio_helper.session_manager = manager
+    return manager
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from typing import TypeVar
+
+from aiohttp import web
+
+_log = logging.getLogger(__name__)
+
+__all__ = (
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Summary",
+    "Registry",
+    "REGISTRY",
+    "TELEGRAM_REQUESTS",
+    "TELEGRAM_ERRORS",
+    "TELEGRAM_LATENCY",
+    "start_metrics_server",
+    "watch_loop_lag"
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, le: str | None = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> list[str]:
+        ...
+
+
+class Counter(_Metric):
+    """Counter increased directly or, with `collect`, read at scrape time from a total kept elsewhere."""
+    kind = "counter"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: Iterable[str] = (),
+            collect: Callable[[], dict[tuple, float]] | None = None
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple, float] = {}
+        self.collect = collect
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        values = self.values if self.collect is None else self.collect()
+        return [f"{self.name}{_labels(self.labels, k)} {v}" for k, v in values.items()]
+
+
+class Gauge(_Metric):
+    """Gauge set directly or, with `collect`, read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: Iterable[str] = (),
+            collect: Callable[[], dict[tuple, float]] | None = None
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple, float] = {}
+        self.collect = collect
+
+    def set(self, *labels, value: float) -> None:
+        self.values[labels] = value
+
+    def render(self) -> list[str]:
+        values = self.values if self.collect is None else self.collect()
+        return [f"{self.name}{_labels(self.labels, k)} {v}" for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: Iterable[str] = (),
+            buckets: Iterable[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        data = self.values.get(labels)
+        if data is None:
+            # per-bucket counts (not cumulative), then sum and count
+            data = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            data[index] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, data in self.values.items():
+            total = 0
+            for bound, count in zip(self.buckets, data, strict=False):
+                total += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, bound)} {total}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels, key, '+Inf')} {data[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {data[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {data[-1]}")
+        return lines
+
+
+class Summary(_Metric):
+    """
+    Quantiles read from a callback at scrape time, e.g. over a window of recent observations.
+
+    Only the quantile series are exported: `_sum` and `_count` must never go down,
+    which a window that forgets old observations cannot promise.
+    """
+    kind = "summary"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: Iterable[str],
+            collect: Callable[[], dict[tuple, dict[float, float]]]
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, quantiles in self.collect().items():
+            for quantile, value in quantiles.items():
+                pairs = _labels((*self.labels, "quantile"), (*key, quantile))
+                lines.append(f"{self.name}{pairs} {value}")
+        return lines
+
+
+M = TypeVar("M", bound=_Metric)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: M) -> M:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                body = metric.render()
+            except Exception:
+                _log.exception("failed to collect %s", metric.name)
+                continue
+            lines.extend(metric.header())
+            lines.extend(body)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+TELEGRAM_REQUESTS = REGISTRY.register(Counter(
+    "tw_telegram_requests_total", "Telegram API calls by bot, chat, method and final outcome.",
+    ("bot", "chat", "method", "status")
+))
+TELEGRAM_ERRORS = REGISTRY.register(Counter(
+    "tw_telegram_errors_total", "Failed Telegram API attempts by bot and error code (429, 5xx, network, ...).",
+    ("bot", "code")
+))
+TELEGRAM_LATENCY = REGISTRY.register(Histogram(
+    "tw_telegram_request_seconds", "Latency of single Telegram API attempts.", ("method",)
+))
+
+
+async def start_metrics_server(host: str, port: int, registry: Registry = REGISTRY) -> web.AppRunner:
+    """Serves `registry` in the Prometheus text format on http://host:port/metrics."""
+    async def handler(_: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    _log.info("metrics are served on http://%s:%s/metrics", host, port)
+    return runner
+
+
+async def watch_loop_lag(gauge: Gauge, interval: float = 1) -> None:
+    """Measures how late the event loop wakes up from a sleep of `interval` seconds."""
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        gauge.set(value=max(0.0, time.monotonic() - start - interval))
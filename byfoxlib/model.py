@@ -1,6 +1,8 @@
-from typing import Any
+from typing import Any, Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+
+from .formatter import Formatter
 
 
 class Path(BaseModel):
@@ -11,19 +13,87 @@ class Path(BaseModel):
     write: str = Field("tw.econ.write.{message_thread_id}")
     tokens: Any
 
+    _formatter: Formatter = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        self._formatter = Formatter(self.pattern)
+
+    @property
+    def formatter(self) -> Formatter:
+        return self._formatter
+
 
 class Nats(BaseModel):
     servers: str | list = Field("127.0.0.1", alias="server")
     user: str = None
     password: str = None
     enable_process_messages: bool = Field(True)
+    route_cache_size: int = Field(1024)
+    fast_decode: bool = Field(False)
+    pull_batch: int = Field(0)
+    pull_timeout: float = Field(1.0)
+    ack_wait: float = Field(30)
+    max_ack_pending: int = Field(1000)
+    heartbeat: float = Field(10)
+    nak_delay: float = Field(5)
+    dedupe_size: int = Field(10000)
+    dedupe_ttl: float = Field(600)
+    publish_window: int = Field(256)
+    publish_timeout: float = Field(5)
+    publish_retries: int = Field(3)
+    duplicate_window: float = Field(30)
+    stream_max_age: float = Field(30)
     paths: list[Path]
 
+    def model_post_init(self, __context: Any) -> None:
+        # JetStream refuses a duplicate window longer than the stream keeps its messages, 0 keeps them forever
+        if self.stream_max_age and self.duplicate_window > self.stream_max_age:
+            raise ValueError(
+                f"duplicate_window ({self.duplicate_window:g}s) exceeds stream_max_age ({self.stream_max_age:g}s)"
+            )
+
+
+class Telegram(BaseModel):
+    flush_window: float = Field(0.3)
+    flush_max_size: int = Field(4096)
+    edit_mode: bool = Field(False)
+    edit_window: float = Field(60)
+    max_workers: int = Field(64)
+    token_rate: float = Field(30)
+    token_burst: float = Field(30)
+    chat_rate: float = Field(20)
+    chat_burst: float = Field(5)
+    max_retries: int = Field(3)
+    backoff_base: float = Field(0.5)
+    backoff_max: float = Field(10)
+    http_limit: int = Field(100)
+    http_limit_per_host: int = Field(50)
+    http_keepalive: float = Field(60)
+    http_dns_ttl: int = Field(300)
+    api_url: str = None
+
+
+class Metrics(BaseModel):
+    enabled: bool = Field(False)
+    host: str = Field("0.0.0.0")
+    port: int = Field(9090)
+    lag_interval: float = Field(1)
+
+
+class Tracing(BaseModel):
+    sink: Literal["none", "ring", "jsonl", "otel"] = Field("none")
+    ring_size: int = Field(100_000)
+    path: str = Field("spans.jsonl")
+
 
 class Config(BaseModel):
     nats: Nats
+    telegram: Telegram = Field(default_factory=Telegram)
+    metrics: Metrics = Field(default_factory=Metrics)
+    tracing: Tracing = Field(default_factory=Tracing)
 
     log_level: str = Field("info")
+    workers: int = Field(1)
     text: str = Field("[TG] {name}: {text}")
     sticker_string: str = Field("[STICKER {sticker_emoji}]")
     video_string: str = Field("[MEDIA]")
@@ -0,0 +1,96 @@
+import json
+from collections.abc import Callable
+
+import telebot
+
+from .message import Message
+from .model import Config
+from .util import check_media, generate_message, generate_message_reply
+
+__all__ = ("Pipeline", "Step", "build_pipelines")
+
+# longest part of a game command taken from one Telegram message
+PART_LIMIT = 255
+
+Step = Callable[[telebot.types.Message], str | None]
+
+
+class Pipeline:
+    """
+    Telegram message -> game command, compiled once per content type.
+
+    Each step turns the message into one part of the command, or None to leave it
+    out; `render` joins the parts. Every config decision is taken when the steps
+    are built, so running a pipeline is a flat loop over plain functions.
+    """
+    __slots__ = ("name", "steps", "render")
+
+    def __init__(self, name: str, steps: list[Step], render: Callable[[list[str]], str]) -> None:
+        self.name = name
+        self.steps = tuple(steps)
+        self.render = render
+
+    def __call__(self, message: telebot.types.Message) -> str:
+        parts = []
+        for step in self.steps:
+            part = step(message)
+            if part is not None:
+                parts.append(part)
+        return self.render(parts)
+
+
+def _say(parts: list[str]) -> str:
+    return str(Message(*parts))
+
+
+def _first(parts: list[str]) -> str:
+    return parts[0]
+
+
+def _raw(message: telebot.types.Message) -> str:
+    return json.dumps(message.__dict__)
+
+
+def _reply(config: Config) -> Step:
+    reply_string, text = config.reply_string, config.text
+
+    def reply(message: telebot.types.Message) -> str | None:
+        if message.reply_to_message is None:
+            return None
+        part = generate_message_reply(reply_string, text, message)
+        return None if part is None else part[:PART_LIMIT]
+    return reply
+
+
+def _text(config: Config) -> Step:
+    text = config.text
+
+    def body(message: telebot.types.Message) -> str:
+        return generate_message(text, message)[:PART_LIMIT]
+    return body
+
+
+def _media(config: Config) -> Step:
+    def media(message: telebot.types.Message) -> str:
+        return check_media(config, message)[:PART_LIMIT]
+    return media
+
+
+def _edit(config: Config) -> Step:
+    edit_string, text = config.edit_string, config.text
+
+    def edit(message: telebot.types.Message) -> str:
+        return f"{edit_string.format(msg_id=message.id)} {generate_message(text, message)[:PART_LIMIT]}"
+    return edit
+
+
+def build_pipelines(config: Config) -> dict[str, Pipeline]:
+    """The pipelines for "text", "media" and "edit" messages as configured."""
+    if not config.nats.enable_process_messages:
+        return {name: Pipeline(name, [_raw], _first) for name in ("text", "media", "edit")}
+
+    return {
+        "text": Pipeline("text", [_reply(config), _text(config)], _say),
+        "media": Pipeline("media", [_reply(config), _media(config)], _say),
+        "edit": Pipeline("edit", [_edit(config)], _say)
+    }
@@ -0,0 +1,78 @@
+import logging
+import time
+
+from .bot import Bot, SendResult, SendStatus
+
+_log = logging.getLogger(__name__)
+
+__all__ = ("TokenPool",)
+
+
+class _Slot:
+    __slots__ = ("bot", "inflight", "sent", "failed", "healthy")
+
+    def __init__(self, bot: Bot) -> None:
+        self.bot = bot
+        self.inflight = 0
+        self.sent = 0
+        self.failed = 0
+        self.healthy = True
+
+
+class TokenPool:
+    """
+    Picks the bot that sends the next message of a path.
+
+    The least loaded healthy bot wins: fewest sends in flight, then fewest sends so far.
+    Bots whose lane for the chat is still paused after a 429 are skipped while another
+    bot is free, and a bot that got 401/403 is taken out of the pool for good.
+    """
+
+    def __init__(self, bots: list[Bot]) -> None:
+        self._slots = [_Slot(bot) for bot in bots]
+
+    def _pick(self, chat_id: int | str) -> _Slot | None:
+        now = time.monotonic()
+        best = None
+        best_rank = None
+        for slot in self._slots:
+            if not slot.healthy:
+                continue
+            paused_until = slot.bot.rate_limiter.chat(chat_id).paused_until
+            rank = (max(0.0, paused_until - now), slot.inflight, slot.sent)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = slot, rank
+        return best
+
+    async def send(self, text: str, chat_id: int | str, thread_id: int | None) -> SendResult:
+        while True:
+            slot = self._pick(chat_id)
+            if slot is None:
+                return SendResult(SendStatus.FORBIDDEN)
+
+            slot.inflight += 1
+            try:
+                result = await slot.bot.send_msg_telegram(text, chat_id, thread_id)
+            finally:
+                slot.inflight -= 1
+
+            if result:
+                slot.sent += 1
+                return result
+
+            slot.failed += 1
+            if result.status is not SendStatus.FORBIDDEN:
+                return result
+            slot.healthy = False
+            _log.error("bot %s removed from the pool of chat %s", slot.bot.token.split(":")[0], chat_id)
+
+    def stats(self) -> dict[str, dict[str, int | bool]]:
+        """Per-token counters keyed by bot id, the secret part of the token is left out."""
+        return {
+            slot.bot.token.split(":")[0]: {
+                "sent": slot.sent,
+                "failed": slot.failed,
+                "inflight": slot.inflight,
+                "healthy": slot.healthy
+            } for slot in self._slots
+        }
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+
+from nats.errors import Error as NatsError
+from nats.js import JetStreamContext
+
+_log = logging.getLogger(__name__)
+
+__all__ = ("Publisher",)
+
+
+class Publisher:
+    """
+    Pipelined JetStream publishing.
+
+    `publish` writes the message right away and returns once it is on the wire, so
+    messages keep their order; the PubAck is awaited in the background. At most
+    `window` publishes are unacknowledged at a time, further ones wait for a slot.
+    A PubAck that fails or does not arrive within `ack_timeout` seconds is retried
+    up to `max_retries` times with a backoff, which is safe as long as the message
+    carries a Nats-Msg-Id. `flush` waits for everything in flight.
+    """
+
+    def __init__(
+            self,
+            js: JetStreamContext,
+            window: int = 256,
+            ack_timeout: float = 5,
+            max_retries: int = 3,
+            backoff: float = 0.5
+    ) -> None:
+        self.js = js
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.failed = 0
+        self._window = asyncio.Semaphore(window)
+        self._inflight: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def publish(self, subject: str, payload: bytes, headers: dict | None = None) -> None:
+        await self._window.acquire()
+        try:
+            ack = await self.js.publish_async(subject, payload, headers=headers)
+        except BaseException:
+            self._window.release()
+            raise
+
+        task = asyncio.create_task(self._confirm(ack, subject, payload, headers))
+        self._inflight.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._inflight.discard(task)
+        self._window.release()
+
+    async def _confirm(self, ack: asyncio.Future, subject: str, payload: bytes, headers: dict | None) -> None:
+        try:
+            await asyncio.wait_for(ack, self.ack_timeout)
+            return
+        except (TimeoutError, NatsError) as e:
+            error = e
+
+        for attempt in range(self.max_retries):
+            _log.debug("publish to %s not acked (%r), retry %s", subject, error, attempt + 1)
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+            try:
+                await self.js.publish(subject, payload, timeout=self.ack_timeout, headers=headers)
+                return
+            except (TimeoutError, NatsError) as e:
+                error = e
+
+        self.failed += 1
+        _log.error("dropping message to %s after %s retries: %r", subject, self.max_retries, error)
+
+    async def flush(self) -> None:
+        while self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+__all__ = ("TokenBucket", "RateLimiter")
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second and holding at most `capacity` tokens."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def level(self) -> float:
+        """Tokens available right now."""
+        self._refill(time.monotonic())
+        return self.tokens
+
+    def pause(self, seconds: float) -> None:
+        """Holds every acquire for `seconds`, e.g. after Telegram answered 429 with retry_after."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 1)
+        self.updated = self.paused_until
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    async def acquire(self) -> None:
+        """Takes one token, waiting in FIFO order until the bucket has capacity."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    Two-level Telegram send limiter for a single bot token.
+
+    Every send takes a token from the per-chat bucket first and then from the
+    bucket shared by the whole bot token, so a busy chat waits for its own
+    budget without holding up the others.
+    """
+
+    def __init__(
+            self,
+            token_rate: float = 30,
+            token_burst: float = 30,
+            chat_rate: float = 20 / 60,
+            chat_burst: float = 5
+    ) -> None:
+        self.token = TokenBucket(token_rate, token_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chats: dict[int | str, TokenBucket] = {}
+
+    def chat(self, chat_id: int | str) -> TokenBucket:
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            bucket = self.chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id: int | str) -> None:
+        await self.chat(chat_id).acquire()
+        await self.token.acquire()
+
+    def pause(self, chat_id: int | str, seconds: float) -> None:
+        self.chat(chat_id).pause(seconds)
+
+    def levels(self) -> dict[str, float | dict[int | str, float]]:
+        """Current bucket levels, for logging and metrics."""
+        return {
+            "token": self.token.level,
+            "chats": {chat_id: bucket.level for chat_id, bucket in self.chats.items()}
+        }
@@ -0,0 +1,67 @@
+from functools import lru_cache
+
+from .model import Path
+
+__all__ = ("Router",)
+
+
+class _Node:
+    __slots__ = ("children", "star", "tail", "paths")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _Node] = {}
+        self.star: _Node | None = None
+        self.tail: list[tuple[int, Path]] = []
+        self.paths: list[tuple[int, Path]] = []
+
+
+class Router:
+    """
+    Subject -> Path index built once from `config.nats.paths`.
+
+    Subscriptions are stored in a token trie that follows NATS wildcard rules:
+    `*` matches exactly one token and `>` matches one or more trailing tokens.
+    When several paths match a subject, the one declared first in the config wins.
+    Lookups are memoized in an LRU cache, so a known subject costs a single dict hit.
+    """
+
+    def __init__(self, paths: list[Path], cache_size: int = 1024) -> None:
+        self._root = _Node()
+        for index, path in enumerate(paths):
+            self.add(index, path)
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def add(self, index: int, path: Path) -> None:
+        node = self._root
+        tokens = path.read.split(".")
+        for i, token in enumerate(tokens):
+            if token == ">":
+                if i != len(tokens) - 1:
+                    raise ValueError(f"'>' must be the last token in subject {path.read!r}")
+                node.tail.append((index, path))
+                return
+            if token == "*":
+                if node.star is None:
+                    node.star = _Node()
+                node = node.star
+            else:
+                node = node.children.setdefault(token, _Node())
+        node.paths.append((index, path))
+
+    def _match(self, subject: str) -> Path | None:
+        tokens = subject.split(".")
+        last = len(tokens)
+        found: list[tuple[int, Path]] = []
+        stack = [(self._root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth == last:
+                found.extend(node.paths)
+                continue
+            found.extend(node.tail)
+            child = node.children.get(tokens[depth])
+            if child is not None:
+                stack.append((child, depth + 1))
+            if node.star is not None:
+                stack.append((node.star, depth + 1))
+        return min(found, key=lambda item: item[0])[1] if found else None
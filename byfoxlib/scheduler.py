@@ -0,0 +1,89 @@
+import asyncio
+from collections.abc import Callable, Hashable
+
+from nats.aio.msg import Msg as MsgNats
+
+from .chunk import TELEGRAM_LIMIT, utf16_len
+
+__all__ = ("Batch", "FlushScheduler")
+
+
+class Batch:
+    """Lines collected for one (chat_id, thread_id) key together with the NATS messages they came from."""
+    __slots__ = ("key", "lines", "messages", "size", "done")
+
+    def __init__(self, key: Hashable) -> None:
+        self.key = key
+        self.lines: list[str] = []
+        self.messages: list[MsgNats] = []
+        self.size = 0
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class FlushScheduler:
+    """
+    Coalesces game lines per key over a time window.
+
+    A key is flushed `window` seconds after its first pending line, or right away before
+    a line would take its newline-joined text past `max_size` UTF-16 code units, which is
+    how Telegram measures a message, so a full batch still fits into one. The batch is
+    handed to `dispatch` right away, which is expected to deliver it in order with the
+    key's earlier batches. Pending text is bounded by `max_size` per key, and the
+    messages behind it by the ack tracker upstream.
+    """
+
+    def __init__(
+            self,
+            dispatch: Callable[[Batch], None],
+            window: float = 0.3,
+            max_size: int = TELEGRAM_LIMIT
+    ) -> None:
+        self.dispatch = dispatch
+        self.window = window
+        self.max_size = max_size
+        self._pending: dict[Hashable, Batch] = {}
+        self._timers: dict[Hashable, asyncio.TimerHandle] = {}
+
+    def add(self, key: Hashable, line: str, message: MsgNats | None = None) -> asyncio.Future:
+        """Queues a line and returns a future resolved once the batch holding it has been flushed."""
+        length = utf16_len(line)
+        batch = self._pending.get(key)
+        if batch is not None and batch.size + 1 + length > self.max_size:
+            self._flush_key(key)
+            batch = None
+        if batch is None:
+            batch = self._pending[key] = Batch(key)
+
+        batch.size += length + 1 if batch.lines else length
+        batch.lines.append(line)
+        if message is not None:
+            batch.messages.append(message)
+
+        if batch.size >= self.max_size:
+            self._flush_key(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush_key, key)
+        return batch.done
+
+    def sizes(self) -> dict[Hashable, int]:
+        """Pending text per key."""
+        return {key: batch.size for key, batch in self._pending.items()}
+
+    def flush_all(self) -> None:
+        """Flushes every pending key right away instead of waiting for its window."""
+        for key in list(self._pending):
+            self._flush_key(key)
+
+    def _flush_key(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        self.dispatch(batch)
+
+    async def close(self) -> None:
+        """Flushes everything that is still pending."""
+        self.flush_all()
@@ -0,0 +1,87 @@
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from bisect import bisect
+from collections.abc import Hashable, Iterable
+from hashlib import blake2b
+
+_log = logging.getLogger(__name__)
+
+__all__ = ("HashRing", "WORKER_ENV", "worker_index", "supervise")
+
+WORKER_ENV = "TW_WORKER"
+
+
+def _hash(value: str) -> int:
+    # stable across processes and restarts, unlike hash()
+    return int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring over `nodes`, each placed `replicas` times.
+
+    `owner` maps a key to the same node in every process, and adding or removing
+    a node only moves the keys that node gains or loses.
+    """
+
+    def __init__(self, nodes: Iterable[Hashable], replicas: int = 64) -> None:
+        ring = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        if not ring:
+            raise ValueError("a hash ring needs at least one node")
+        self._hashes = [h for h, _ in ring]
+        self._nodes = [node for _, node in ring]
+
+    def owner(self, key: Hashable) -> Hashable:
+        return self._nodes[bisect(self._hashes, _hash(str(key))) % len(self._nodes)]
+
+
+def worker_index() -> int | None:
+    """Index of this worker under `supervise`, None when running standalone."""
+    value = os.environ.get(WORKER_ENV)
+    return None if value is None else int(value)
+
+
+def supervise(workers: int, restart_delay: float = 1) -> int:
+    """
+    Runs `workers` copies of the current program, each with its index in TW_WORKER.
+
+    A worker that exits is started again after `restart_delay` seconds. SIGINT and
+    SIGTERM are passed on to the workers as SIGINT, so they shut down gracefully,
+    and the supervisor returns once all of them are gone.
+    """
+    stopping = False
+    procs: dict[int, subprocess.Popen] = {}
+
+    def spawn(index: int) -> None:
+        procs[index] = subprocess.Popen([sys.executable, *sys.argv], env={**os.environ, WORKER_ENV: str(index)})
+        _log.info("worker %s started as pid %s", index, procs[index].pid)
+
+    def stop(*_) -> None:
+        nonlocal stopping
+        stopping = True
+        for proc in procs.values():
+            proc.send_signal(signal.SIGINT)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for index in range(workers):
+        spawn(index)
+
+    while procs:
+        pid, status = os.wait()
+        index = next((i for i, proc in procs.items() if proc.pid == pid), None)
+        if index is None:
+            continue
+        del procs[index]
+        if stopping:
+            continue
+        _log.warning("worker %s exited with %s, restarting", index, os.waitstatus_to_exitcode(status))
+        time.sleep(restart_delay)
+        if not stopping:
+            spawn(index)
+    return 0
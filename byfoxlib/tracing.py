@@ -0,0 +1,126 @@
+import json
+import time
+from collections import deque
+from typing import Protocol
+
+__all__ = (
+    "Sink",
+    "RingBufferSink",
+    "JsonLinesSink",
+    "OpenTelemetrySink",
+    "Tracer",
+    "TRACER"
+)
+
+
+class Sink(Protocol):
+    def record(self, name: str, start_ns: int, duration_ns: int) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class RingBufferSink:
+    """Keeps the last `size` spans in memory and summarizes them per stage."""
+
+    def __init__(self, size: int = 100_000) -> None:
+        self.spans: deque[tuple[str, int]] = deque(maxlen=size)
+
+    def record(self, name: str, start_ns: int, duration_ns: int) -> None:
+        self.spans.append((name, duration_ns))
+
+    def summary(self, quantiles: tuple[float, ...] = (0.5, 0.99)) -> dict[str, dict[float, float]]:
+        """Per-stage quantiles of the buffered spans, in seconds."""
+        stages: dict[str, list[int]] = {}
+        for name, duration in self.spans:
+            stages.setdefault(name, []).append(duration)
+
+        result = {}
+        for name, durations in stages.items():
+            durations.sort()
+            last = len(durations) - 1
+            result[name] = {q: durations[round(q * last)] / 1e9 for q in quantiles}
+        return result
+
+    def close(self) -> None:
+        pass
+
+
+class JsonLinesSink:
+    """Appends one JSON object per span to `path`; writes go through a regular buffered file."""
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, name: str, start_ns: int, duration_ns: int) -> None:
+        self._file.write(json.dumps({"name": name, "start_ns": start_ns, "duration_ns": duration_ns}) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class OpenTelemetrySink:
+    """Hands spans to the globally configured OpenTelemetry tracer provider (needs opentelemetry-api)."""
+
+    def __init__(self, name: str = "nats-to-telegram") -> None:
+        from opentelemetry import trace
+
+        self._tracer = trace.get_tracer(name)
+
+    def record(self, name: str, start_ns: int, duration_ns: int) -> None:
+        self._tracer.start_span(name, start_time=start_ns).end(end_time=start_ns + duration_ns)
+
+    def close(self) -> None:
+        pass
+
+
+class _Span:
+    __slots__ = ("sink", "name", "wall", "start")
+
+    def __init__(self, sink: Sink, name: str) -> None:
+        self.sink = sink
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.wall = time.time_ns()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.sink.record(self.name, self.wall, time.perf_counter_ns() - self.start)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *_) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Times hot-path stages and hands the spans to a pluggable sink.
+
+    Without a sink `span` returns a shared no-op context manager, so the
+    instrumentation can stay in place at almost no cost.
+    """
+
+    def __init__(self, sink: Sink | None = None) -> None:
+        self.sink = sink
+
+    def span(self, name: str) -> _Span | _NullSpan:
+        if self.sink is None:
+            return _NULL_SPAN
+        return _Span(self.sink, name)
+
+    def close(self) -> None:
+        if self.sink is not None:
+            self.sink.close()
+
+
+TRACER = Tracer()
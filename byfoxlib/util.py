@@ -1,22 +1,32 @@
 import logging
 import re
+from collections.abc import Iterable
+from string import Formatter
 
 import nats
 import telebot
 import yaml
 from nats.aio.client import Client
 from nats.js import JetStreamContext
+from nats.js.api import AckPolicy, ConsumerConfig, DeliverPolicy
 from nats.js.errors import NotFoundError
 
 from .emojies import replace_from_emoji
 from .model import Config
+from .publish import Publisher
+from .tracing import TRACER
 
 _log = logging.getLogger(__name__)
 
+DEFAULT_WRITE = "tw.econ.write.{message_thread_id}"
+
 __all__ = (
     "Nats",
     "get_config",
     "nats_connect",
+    "nats_msg_id",
+    "text_replace",
+    "text_replace_many",
     "format_mention",
     "text_format",
     "regex_format",
@@ -27,35 +37,139 @@ __all__ = (
 
 
 class Nats:
-    def __init__(self, tuple_nats: tuple[Client, JetStreamContext]) -> None:
+    def __init__(
+            self,
+            tuple_nats: tuple[Client, JetStreamContext],
+            publish_window: int = 256,
+            publish_timeout: float = 5,
+            publish_retries: int = 3,
+            writers: dict[int | None, str] | None = None
+    ) -> None:
         self.ns, self.js = tuple_nats
         self.server_name: dict = {}
+        self.writers = writers or {}
+        self.publisher = Publisher(self.js, publish_window, publish_timeout, publish_retries)
+        self._subjects: dict[int | None, str | None] = {}
+
+    def set_server_name(self, thread_id: int | None, server_name: str | None) -> None:
+        self.server_name[thread_id] = server_name
+        self._subjects.pop(thread_id, None)
 
-    async def check_stream(self, namespace: str, **kwargs):
+    def subject(self, thread_id: int | None) -> str | None:
+        """
+        Write subject of a thread, resolved once and cached until its server name changes.
+
+        None while the thread's write path needs a `{server_name}` that is not known yet.
+        """
         try:
-            await self.js.stream_info(namespace)
-        except NotFoundError:
+            return self._subjects[thread_id]
+        except KeyError:
             pass
+
+        pattern = self.writers.get(thread_id, DEFAULT_WRITE)
+        server_name = self.server_name.get(thread_id)
+        if server_name is None and any(field == "server_name" for _, field, _, _ in Formatter().parse(pattern)):
+            subject = None
         else:
-            await self.js.delete_stream(namespace)
-        await self.js.add_stream(name=namespace, **kwargs)
+            subject = pattern.format(message_thread_id=thread_id, server_name=server_name)
+        self._subjects[thread_id] = subject
+        return subject
 
-    async def send_message(
-            self,
-            write_path: str,
-            text: str,
-            message: telebot.types.Message
-    ) -> None:
-        path = write_path.format(message_thread_id=message.message_thread_id,
-                              server_name=self.server_name.get(message.message_thread_id))
+    async def check_stream(self, namespace: str, **kwargs) -> None:
+        """
+        Brings the stream in line with `kwargs` without losing what it holds.
+
+        A missing stream is created; an existing one is updated only when one of the
+        given fields differs, so its messages and consumers survive restarts.
+        """
+        try:
+            info = await self.js.stream_info(namespace)
+        except NotFoundError:
+            await self.js.add_stream(name=namespace, **kwargs)
+            _log.info("stream %s created", namespace)
+            return
+
+        changed = _changed(info.config, kwargs)
+        if changed:
+            await self.js.update_stream(info.config.evolve(**kwargs))
+            _log.info("stream %s updated: %s", namespace, ", ".join(changed))
+
+    async def check_consumer(self, stream: str, durable: str, pull: bool, **kwargs) -> None:
+        """
+        Updates an existing durable consumer whose settings differ from `kwargs`.
+
+        Missing consumers are left to `subscribe`, which creates them with its own
+        delivery settings; existing ones keep their position either way. A durable
+        left behind by the other mode, push where `pull` is wanted or the other way
+        round, cannot be switched in place, so it is recreated right after its ack floor.
+        """
+        try:
+            info = await self.js.consumer_info(stream, durable)
+        except NotFoundError:
+            return
+
+        if (info.config.deliver_subject is None) != pull:
+            config = ConsumerConfig(
+                durable_name=durable,
+                filter_subject=info.config.filter_subject,
+                ack_policy=AckPolicy.EXPLICIT,
+                deliver_policy=DeliverPolicy.BY_START_SEQUENCE,
+                opt_start_seq=info.ack_floor.stream_seq + 1,
+                deliver_subject=None if pull else self.ns.new_inbox()
+            ).evolve(**kwargs)
+            await self.js.delete_consumer(stream, durable)
+            await self.js.add_consumer(stream, config)
+            _log.warning(
+                "consumer %s recreated as a %s consumer from sequence %s",
+                durable, "pull" if pull else "push", config.opt_start_seq
+            )
+            return
+
+        changed = _changed(info.config, kwargs)
+        if changed:
+            await self.js.add_consumer(stream, info.config.evolve(**kwargs))
+            _log.info("consumer %s updated: %s", durable, ", ".join(changed))
+
+    async def send_message(self, text: str, message: telebot.types.Message) -> bool:
+        """Publishes `text` to the thread's write subject; False when the subject cannot be resolved yet."""
+        path = self.subject(message.message_thread_id)
+        if path is None:
+            _log.warning("no server name for thread %s yet, dropping %r", message.message_thread_id, text)
+            return False
         logging.debug(f"Sending message to {path}, {text}")
-        await self.js.publish(
+        await self.publisher.publish(
             path,
             text.encode(),
-            headers={
-                "Nats-Msg-Id": f"{message.from_user.id}_{message.date}_{hash(text)}_{message.message_thread_id}"
-            }
+            headers={"Nats-Msg-Id": nats_msg_id(message)}
         )
+        return True
+
+    async def flush(self) -> None:
+        """Waits until every pending publish has been acked or given up on."""
+        await self.publisher.flush()
+
+
+def nats_msg_id(message: telebot.types.Message) -> str:
+    """
+    Nats-Msg-Id of a Telegram message for JetStream duplicate detection.
+
+    Built from the chat, message id and edit date only, so a message Telegram
+    delivers again, e.g. after a restart, gets the same id, while every edit
+    gets a new one.
+    """
+    return f"tg_{message.chat.id}_{message.message_id}_{message.edit_date or 0}"
+
+
+def _changed(current, desired: dict) -> list[str]:
+    """Names of the `desired` fields that differ from the `current` JetStream config."""
+    changed = []
+    for name, value in desired.items():
+        have = getattr(current, name)
+        if isinstance(value, list | tuple):
+            value, have = sorted(value), sorted(have or ())
+        if have != value:
+            changed.append(name)
+    return changed
 
 
 def get_config(modal):
@@ -68,13 +182,24 @@ def get_config(modal):
 
 
 def text_replace(msg: str) -> str:
+    # four str.replace calls beat any single pass (str.translate, re.sub) in CPython:
+    # each is a C scan that returns the string as is when there is nothing to escape
     return msg.replace("\\", "\\\\").replace("\'", "\\\'").replace("\"", "\\\"").replace("\n", " ")
 
 
+def text_replace_many(texts: Iterable[str]) -> list[str]:
+    """`text_replace` over a batch of strings, e.g. all parts of one game command."""
+    return list(map(text_replace, texts))
+
+
 def generate_message(env_text: str, _msg: telebot.types.Message, text: str = None) -> str:
+    if text is None:
+        with TRACER.span("echo.emoji"):
+            text = replace_from_emoji(_msg.text)
+        text = text_replace(text)
     return env_text.format(
         name=_msg.from_user.first_name + (_msg.from_user.last_name or ''),
-        text=text_replace(replace_from_emoji(_msg.text)) if text is None else text
+        text=text
     )
 
 
@@ -88,12 +213,12 @@ def generate_message_reply(reply_string: str, env_text: str, _msg: telebot.types
 
 def check_media(env: Config, message: telebot.types.Message) -> str:
     if message.sticker is not None:
+        with TRACER.span("echo.emoji"):
+            sticker_emoji = replace_from_emoji(message.sticker.emoji)
         return generate_message(
             env.text,
             message,
-            env.sticker_string.format(
-                sticker_emoji=replace_from_emoji(message.sticker.emoji)
-            )
+            env.sticker_string.format(sticker_emoji=sticker_emoji)
         )
     for i in [
         "video",
@@ -102,7 +227,7 @@ def check_media(env: Config, message: telebot.types.Message) -> str:
         "voice"
     ]:
         if getattr(message, i) is not None:
-            return generate_message(env.text, getattr(env, i + '_string'))
+            return generate_message(env.text, message, getattr(env, i + '_string'))
     return ""
 
 
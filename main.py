@@ -1,14 +1,21 @@
 import asyncio
+import contextlib
 import json
 import logging
-from itertools import cycle
+import signal
+import sys
 
 import telebot.types
+from telebot import asyncio_helper
 from nats.aio.msg import Msg as MsgNats
-from telebot.util import split_string
+from nats.js import JetStreamContext
+from nats.js.api import ConsumerConfig
 
-from byfoxlib import Message, Bot, nats_connect, get_config, generate_message_reply, generate_message, check_media, \
-    Nats, Config, Msg, Path
+from byfoxlib import Bot, nats_connect, get_config, Nats, Config, Path, Router, Batch, FlushScheduler, \
+    RateLimiter, SendStatus, Dispatcher, decode_fast, decode_model, TokenPool, SessionManager, \
+    install_session_manager, AckTracker, ChunkBuilder, ThreadAppender, SequenceDedupe, sequence_key, REGISTRY, \
+    Counter, Gauge, Summary, start_metrics_server, watch_loop_lag, TRACER, RingBufferSink, JsonLinesSink, \
+    OpenTelemetrySink, HashRing, worker_index, supervise, Pipeline, build_pipelines
 
 config: Config = get_config(Config)
 
@@ -16,154 +23,425 @@ logging.basicConfig(format='%(asctime)s:%(levelname)s:%(name)s: %(message)s')
 log = logging.getLogger("root")
 log.setLevel(getattr(logging, config.log_level.upper()))
 
-writers: dict[int, str] = {}
-readers: dict[str, Path] = {}
+# worker index under the supervisor (config.workers > 1), None when running standalone
+worker = worker_index()
+SERVER_NAMES = "tw_bridge.server_name"
+
+writers: dict[int | None, str] = {}
+if config.telegram.api_url is not None:
+    asyncio_helper.API_URL = config.telegram.api_url
+session_manager = install_session_manager(SessionManager(
+    config.telegram.http_limit,
+    config.telegram.http_limit_per_host,
+    config.telegram.http_keepalive,
+    config.telegram.http_dns_ttl
+))
+
+
+def make_bot(token: str, share: int = 1) -> Bot:
+    """A bot for `token` that takes its `share` of the token's rate, when several workers send with it."""
+    return Bot(
+        token,
+        rate_limiter=RateLimiter(
+            config.telegram.token_rate / share,
+            max(config.telegram.token_burst / share, 1),
+            config.telegram.chat_rate / 60,
+            config.telegram.chat_burst
+        ),
+        max_retries=config.telegram.max_retries,
+        backoff_base=config.telegram.backoff_base,
+        backoff_max=config.telegram.backoff_max
+    )
+
 
 for path in config.nats.paths:
     if isinstance(path.tokens, str):
-        Bot(path.tokens)
-    else:
+        path.tokens = [path.tokens]
+
+# each worker serves the paths of the chats the ring gives it, so lines of one chat stay in order
+# Telegram limits a token as a whole, so a token used on several workers is split evenly between them
+token_workers: dict[str, set[int]] = {}
+if worker is None:
+    owned = list(enumerate(config.nats.paths))
+else:
+    ring = HashRing(range(config.workers))
+    owned = []
+    for i, path in enumerate(config.nats.paths):
+        owner = ring.owner(path.chat_id)
         for token in path.tokens:
-            Bot(token)
+            token_workers.setdefault(token, set()).add(owner)
+        if owner == worker:
+            owned.append((i, path))
 
-    path.tokens = cycle(path.tokens)
-    readers[path.read] = path
-    writers[path.thread_id] = path.write
+for token in dict.fromkeys(token for path in config.nats.paths for token in path.tokens):
+    make_bot(token, len(token_workers.get(token, ())) or 1)
 
-readers_keys = list(readers.keys())
 bots: dict[str, Bot] = Bot.get_tokens()
 bot = list(bots.values())[0]
 
+for path in config.nats.paths:
+    path.tokens = TokenPool([bots[token] for token in path.tokens])
+    writers[path.thread_id] = path.write
+
+if config.tracing.sink == "ring":
+    TRACER.sink = RingBufferSink(config.tracing.ring_size)
+elif config.tracing.sink == "jsonl":
+    TRACER.sink = JsonLinesSink(config.tracing.path if worker is None else f"{config.tracing.path}.{worker}")
+elif config.tracing.sink == "otel":
+    TRACER.sink = OpenTelemetrySink()
+
+router = Router([path for _, path in owned], config.nats.route_cache_size)
+decode = decode_fast if config.nats.fast_decode else decode_model
+pipelines = build_pipelines(config)
+
 nats: Nats | None = None
-buffer_text = {}
+scheduler: FlushScheduler | None = None
+dispatcher: Dispatcher | None = None
+targets: dict[tuple[int | str, int | None], Path] = {}
+appender = ThreadAppender(config.telegram.edit_window) if config.telegram.edit_mode else None
+acks = AckTracker(config.nats.max_ack_pending, config.nats.heartbeat, config.nats.nak_delay)
+dedupe = SequenceDedupe(config.nats.dedupe_size, config.nats.dedupe_ttl)
+
+consumed = REGISTRY.register(Counter("tw_messages_consumed_total", "Game lines consumed from NATS.", ("subject",)))
+loop_lag = REGISTRY.register(Gauge("tw_event_loop_lag_seconds", "How late the event loop woke up last time."))
+REGISTRY.register(Gauge("tw_ack_pending", "Messages delivered but not yet acked.", collect=lambda: {(): acks.pending}))
+REGISTRY.register(Counter(
+    "tw_duplicates_dropped_total", "Redelivered messages dropped by sequence.", collect=lambda: {(): dedupe.dropped}
+))
+REGISTRY.register(Gauge(
+    "tw_publish_inflight", "Publishes to the game side awaiting their PubAck.",
+    collect=lambda: {(): len(nats.publisher)} if nats else {}
+))
+REGISTRY.register(Counter(
+    "tw_publish_failed_total", "Publishes to the game side dropped after all retries.",
+    collect=lambda: {(): nats.publisher.failed} if nats else {}
+))
+REGISTRY.register(Gauge(
+    "tw_buffer_length", "Pending text per chat thread, in UTF-16 code units.", ("chat", "thread"),
+    collect=lambda: scheduler.sizes() if scheduler else {}
+))
+REGISTRY.register(Counter(
+    "tw_telegram_connections_total", "Telegram HTTP connections by how they were obtained.", ("kind",),
+    collect=lambda: {("opened",): session_manager.created, ("reused",): session_manager.reused}
+))
+
+
+def rate_limit_levels() -> dict[tuple, float]:
+    levels = {}
+    for token_bot in bots.values():
+        current = token_bot.rate_limiter.levels()
+        levels[(token_bot.bot_id, "token", "")] = current["token"]
+        for chat_id, level in current["chats"].items():
+            levels[(token_bot.bot_id, "chat", chat_id)] = level
+    return levels
+
+
+REGISTRY.register(Gauge(
+    "tw_rate_limit_tokens", "Sends each rate limit bucket allows right now, per bot token and per chat.",
+    ("bot", "scope", "chat"), collect=rate_limit_levels
+))
+
+if isinstance(TRACER.sink, RingBufferSink):
+    REGISTRY.register(Summary(
+        "tw_stage_seconds", "Hot-path stage latency over the span ring buffer.", ("stage",),
+        collect=lambda: {(stage,): quantiles for stage, quantiles in TRACER.sink.summary().items()}
+    ))
 
 
 async def message_handler_telegram(message: MsgNats):
     """Takes a message from nats and sends it to telegram."""
-    await message.in_progress()
-
-    msg = Msg(**json.loads(message.data.decode()))
-    key = msg.args.server_name or msg.args.message_thread_id
+    await handle_message(message)
+
+
+async def pull_handler_telegram(psub: JetStreamContext.PullSubscription):
+    """Fetches game lines in batches and waits until the whole batch has been delivered before the next fetch."""
+    while True:
+        try:
+            messages = await psub.fetch(config.nats.pull_batch, config.nats.pull_timeout)
+        except TimeoutError:
+            # an empty fetch ends in nats' TimeoutError or asyncio's, both subclass the builtin one
+            continue
+        except Exception:
+            log.exception("fetching game lines failed")
+            await asyncio.sleep(config.nats.pull_timeout)
+            continue
+
+        try:
+            await handle_fetched(messages)
+        except Exception:
+            # whatever the batch left unsettled is redelivered, the loop goes on
+            log.exception("handling %s fetched game lines failed", len(messages))
+            await acks.nak(messages)
+
+
+async def handle_fetched(messages: list[MsgNats]) -> None:
+    pending = []
+    results = await asyncio.gather(*(handle_message(m) for m in messages), return_exceptions=True)
+    for message, result in zip(messages, results, strict=True):
+        if isinstance(result, Exception):
+            log.error("dropping message on %s: %r", message.subject, result)
+            await acks.term([message])
+        elif result is not None:
+            pending.append(result)
+    scheduler.flush_all()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def handle_message(message: MsgNats) -> asyncio.Future | None:
+    """Queues a game line for its chat thread; returns a future resolved once it has been flushed."""
+    await acks.track(message)
+    consumed.inc(message.subject)
+    try:
+        return await queue_message(message)
+    except Exception as e:
+        # a bad envelope would otherwise hold its ack slot, and get heartbeats, forever
+        log.warning("dropping message on %s: %r", message.subject, e)
+        await acks.term([message])
+        return None
+
+
+async def queue_message(message: MsgNats) -> asyncio.Future | None:
+    key = sequence_key(message)
+    if dedupe.seen(key):
+        log.debug("dropping redelivered %s, %s duplicates so far", message.subject, dedupe.dropped)
+        if acks.holds(key) > 1:
+            # the first copy is still on its way; acking this one would settle it on the server,
+            # so a failed send could no longer nak it
+            await acks.release([message])
+        else:
+            await acks.ack([message])
+        return None
+
+    with TRACER.span("game.decode"):
+        msg = decode(message.data)
     logging.debug("%s > %s", message.subject, msg.value)
 
-    rd_path = next((i for i in readers_keys if any(
-        sub1 == sub2 or sub2 == "*" for sub1, sub2 in zip(message.subject.split("."), i.split("."), strict=False))), "")
-
-    if not rd_path:
-        return await message.ack()
-
-    reader = readers.get(rd_path)
+    with TRACER.span("game.route"):
+        reader = router.match(message.subject)
     if reader is None:
-        return await message.ack()
-
-    if buffer_text.get(key) is None:
-        buffer_text[key] = ""
+        await acks.ack([message])
+        return None
 
     if nats.server_name.get(msg.args.message_thread_id) is None:
-        nats.server_name[msg.args.message_thread_id] = msg.args.server_name
+        nats.set_server_name(msg.args.message_thread_id, msg.args.server_name)
+        if worker:
+            await share_server_name(msg.args.message_thread_id, msg.args.server_name)
 
     if not msg.value[0]:
         msg.value.pop(0)
 
-    buffer_text[key] += (": ".join(msg.value) if reader.pattern is None else reader.pattern.format(msg.value)) + "\n"
+    key = (reader.chat_id, msg.args.message_thread_id or reader.thread_id)
+    targets[key] = reader
+    with TRACER.span("game.format"):
+        text = reader.formatter.format(msg.value)
+    with TRACER.span("game.buffer"):
+        return scheduler.add(key, text, message)
+
+
+async def flush_telegram(batch: Batch) -> bool:
+    """
+    Sends the coalesced lines of one chat thread and settles the messages they came from.
+
+    Every line comes from one message, in order, so the messages behind a chunk are acked as
+    soon as Telegram confirmed it. If a chunk fails, a transient failure naks the rest with a
+    delay so JetStream redelivers them later, a permanent one terminates them. An unexpected
+    error naks whatever is not settled yet.
+    """
+    try:
+        return await send_batch(batch)
+    except Exception:
+        log.exception("delivery to chat %s failed", batch.key[0])
+        for message in batch.messages:
+            dedupe.forget(sequence_key(message))
+        # the tracker skips messages that were already settled
+        await acks.nak(batch.messages)
+        return False
+
+
+async def send_batch(batch: Batch) -> bool:
+    chat_id, thread_id = batch.key
+    reader = targets[batch.key]
+
+    delivered = 0
+    for chunk, end in ChunkBuilder.build_marked(batch.lines):
+        with TRACER.span("game.send"):
+            if appender is None:
+                result = await reader.tokens.send(chunk, chat_id, thread_id)
+            else:
+                result = await appender.send(reader.tokens, chunk, chat_id, thread_id)
+        if not result:
+            break
+        if end > delivered:
+            with TRACER.span("game.ack"):
+                await acks.ack(batch.messages[delivered:end])
+            delivered = end
+    else:
+        return True
 
-    list_text = [buffer_text[key]] if len(buffer_text[key]) < 4000 else split_string(buffer_text[key], 2000)
-    thread_id = msg.args.message_thread_id or reader.thread_id
+    rest = batch.messages[delivered:]
+    with TRACER.span("game.ack"):
+        if result.status is SendStatus.FAILED:
+            for message in rest:
+                dedupe.forget(sequence_key(message))
+            await acks.nak(rest)
+        else:
+            log.warning("dropping %s lines for chat %s: %s", len(batch.lines) - delivered, chat_id, result)
+            await acks.term(rest)
+    return False
 
-    for text in list_text:
-        bot_ = bots.get(next(reader.tokens))
-        if await bot_.send_msg_telegram(
-                text,
-                reader.chat_id,
-                thread_id
-        ):
-            buffer_text[key] = ""
 
-    await message.ack()
-    # await message.term()
+async def share_server_name(thread_id: int | None, server_name: str | None) -> None:
+    """Tells worker 0, which publishes the Telegram side, a server name this worker has learned."""
+    await nats.ns.publish(SERVER_NAMES, json.dumps([thread_id, server_name]).encode())
 
 
-async def main():
-    global nats
+async def share_server_names(_: MsgNats) -> None:
+    """Answers the sync request worker 0 sends when it (re)starts."""
+    for item in list(nats.server_name.items()):
+        await share_server_name(*item)
 
-    nats = Nats(await nats_connect(config))
-    await nats.check_stream("tw", subjects=['tw.*', 'tw.*.*', 'tw.*.*.*'], max_msgs=1000, max_age=30)
 
-    for _path in config.nats.paths:
-        await nats.js.subscribe(_path.read, "telegram_bot", cb=message_handler_telegram)
-    logging.info("nats js subscribe \"tw.tg.*\"")
-    logging.info("bot is running")
+async def learn_server_name(message: MsgNats) -> None:
+    thread_id, server_name = json.loads(message.data)
+    if nats.server_name.get(thread_id) is None:
+        nats.set_server_name(thread_id, server_name)
+
+
+def setup_pipeline() -> None:
+    """Creates the coalescing scheduler and the send workers behind it."""
+    global scheduler, dispatcher
+
+    dispatcher = Dispatcher(flush_telegram, config.telegram.max_workers)
+    scheduler = FlushScheduler(dispatcher.submit, config.telegram.flush_window, config.telegram.flush_max_size)
 
-    await bot.infinity_polling(
-        logger_level=logging.DEBUG,
-        allowed_updates=["message", "edited_message"]
+
+async def setup_stream(client: Nats) -> None:
+    await client.check_stream(
+        "tw", subjects=['tw.*', 'tw.*.*', 'tw.*.*.*'], max_msgs=1000,
+        max_age=config.nats.stream_max_age, duplicate_window=config.nats.duplicate_window
     )
 
 
-@bot.message_handler(content_types=["photo", "sticker", "sticker", "audio", "voice"])
-async def echo_media(message: telebot.types.Message):
-    if nats is None or message is None:
-        return
+async def prepare_workers() -> None:
+    """Sets the stream up once in the supervisor, before any worker subscribes to it."""
+    client = Nats(await nats_connect(config))
+    await setup_stream(client)
+    await client.ns.close()
 
-    wr = writers.get(message.message_thread_id)
-    if wr is None:
-        wr = "tw.econ.write.{message_thread_id}"
 
-    if config.nats.enable_process_messages:
-        msg = Message()
+async def main():
+    global nats
 
-        if message.reply_to_message is not None:
-            reply = generate_message_reply(config.reply_string, config.text, message)
-            msg + reply[:255] if reply is not None else ""
-        msg + check_media(config, message)[:255]
-        data = str(msg)
-    else:
-        data = json.dumps(message.__dict__)
+    # `docker stop` sends SIGTERM, which takes the same way out as Ctrl+C, so in-flight publishes are flushed
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
 
-    await nats.send_message(wr, data, message)
+    background = []
+    if config.metrics.enabled:
+        await start_metrics_server(config.metrics.host, config.metrics.port + (worker or 0))
+        background.append(asyncio.create_task(watch_loop_lag(loop_lag, config.metrics.lag_interval)))
 
+    nats = Nats(
+        await nats_connect(config),
+        config.nats.publish_window,
+        config.nats.publish_timeout,
+        config.nats.publish_retries,
+        writers
+    )
+    setup_pipeline()
+    if worker is None:
+        await setup_stream(nats)
+
+    if worker == 0:
+        await nats.ns.subscribe(SERVER_NAMES, cb=learn_server_name)
+        await nats.ns.publish(f"{SERVER_NAMES}.sync", b"")
+    elif worker:
+        await nats.ns.subscribe(f"{SERVER_NAMES}.sync", cb=share_server_names)
+
+    # one durable per path, named after its place in the config, so it stays the same whichever worker runs it
+    # existing durables resume from their last ack, restarts and rolling deploys lose nothing
+    # the paths share the tracker's slots, so together they are handed no more than it holds
+    max_ack_pending = max(config.nats.max_ack_pending // max(len(owned), 1), 1)
+    for i, _path in owned:
+        durable = f"telegram_bot_{i}"
+        await nats.check_consumer(
+            "tw", durable, config.nats.pull_batch > 0,
+            filter_subject=_path.read, ack_wait=config.nats.ack_wait, max_ack_pending=max_ack_pending
+        )
+        # a fresh config each time: subscribe fills in durable and filter on the object it is given
+        consumer = ConsumerConfig(ack_wait=config.nats.ack_wait, max_ack_pending=max_ack_pending)
+        if config.nats.pull_batch > 0:
+            psub = await nats.js.pull_subscribe(_path.read, durable=durable, config=consumer)
+            background.append(asyncio.create_task(pull_handler_telegram(psub)))
+        else:
+            await nats.js.subscribe(
+                _path.read, durable, cb=message_handler_telegram, config=consumer, manual_ack=True
+            )
+        logging.info("nats js subscribe \"%s\"", _path.read)
+    logging.info("bot is running")
 
-@bot.message_handler(content_types=["text"])
-async def echo_text(message: telebot.types.Message):
-    if nats is None or message is None or message.text.startswith("/"):
+    try:
+        if worker:
+            # Telegram allows a single getUpdates poller per token, that is worker 0
+            await asyncio.Future()
+        else:
+            await bot.infinity_polling(
+                logger_level=logging.DEBUG,
+                allowed_updates=["message", "edited_message"]
+            )
+    finally:
+        for task in background:
+            task.cancel()
+        await scheduler.close()
+        await dispatcher.close()
+        await acks.close()
+        await nats.flush()
+        log.info("telegram connections: %s opened, %s reused", session_manager.created, session_manager.reused)
+        await session_manager.close()
+        if isinstance(TRACER.sink, RingBufferSink):
+            for stage, quantiles in sorted(TRACER.sink.summary().items()):
+                log.info("%s: p50 %.6fs, p99 %.6fs", stage, quantiles[0.5], quantiles[0.99])
+        TRACER.close()
+
+
+async def echo(pipeline: Pipeline, message: telebot.types.Message) -> None:
+    """Turns a Telegram message into a game command with its pipeline and publishes it."""
+    if nats is None or message is None:
         return
 
-    wr = writers.get(message.message_thread_id)
-    if wr is None:
-        wr = "tw.econ.write.{message_thread_id}"
+    with TRACER.span("echo.format"):
+        data = pipeline(message)
 
-    if config.nats.enable_process_messages:
-        msg = Message()
+    with TRACER.span("echo.publish"):
+        await nats.send_message(data, message)
 
-        if message.reply_to_message is not None:
-            reply = generate_message_reply(config.reply_string, config.text, message)
-            msg + reply[:255] if reply is not None else ""
-        msg + generate_message(config.text, message)[:255]
-        data = str(msg)
-    else:
-        data = json.dumps(message.__dict__)
 
-    await nats.send_message(wr, data, message)
+def not_command(message: telebot.types.Message) -> bool:
+    return not message.text.startswith("/")
 
 
-@bot.edited_message_handler(content_types=["text"])
-async def echo_edit_text(message: telebot.types.Message):
-    if nats is None or message is None or message.text.startswith("/"):
-        return
+@bot.message_handler(content_types=["photo", "sticker", "audio", "voice"])
+async def echo_media(message: telebot.types.Message):
+    await echo(pipelines["media"], message)
 
-    wr = writers.get(message.message_thread_id)
-    if wr is None:
-        wr = "tw.econ.write.{message_thread_id}"
 
-    if config.nats.enable_process_messages:
-        string = config.edit_string.format(msg_id=message.id)
-        text = generate_message(config.text, message)[:255]
-        data = str(Message(f"{string} {text}"))
-    else:
-        data = json.dumps(message.__dict__)
+@bot.message_handler(content_types=["text"], func=not_command)
+async def echo_text(message: telebot.types.Message):
+    await echo(pipelines["text"], message)
 
-    await nats.send_message(wr, data, message)
+
+@bot.edited_message_handler(content_types=["text"], func=not_command)
+async def echo_edit_text(message: telebot.types.Message):
+    await echo(pipelines["edit"], message)
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    if config.workers > 1 and worker is None:
+        asyncio.run(prepare_workers())
+        sys.exit(supervise(config.workers))
+    if worker is None:
+        with contextlib.suppress(asyncio.CancelledError):
+            asyncio.run(main())
+    else:
+        # the supervisor stops its workers with SIGINT
+        with contextlib.suppress(KeyboardInterrupt):
+            asyncio.run(main())
@@ -0,0 +1,51 @@
+import asyncio
+import random
+
+from byfoxlib import Dispatcher, FlushScheduler
+
+
+def test_batches_of_a_key_keep_their_order_under_backpressure():
+    async def run() -> dict[str, list[int]]:
+        delivered: dict[str, list[int]] = {"a": [], "b": []}
+
+        async def handle(batch) -> bool:
+            # slow, uneven deliveries so flushes pile up behind each key's worker
+            await asyncio.sleep(random.uniform(0, 0.001))
+            delivered[batch.key].extend(int(line) for line in batch.lines)
+            return True
+
+        dispatcher = Dispatcher(handle, max_workers=1)
+        scheduler = FlushScheduler(dispatcher.submit, window=0.001, max_size=1)
+        futures = []
+        for i in range(1000):
+            futures.append(scheduler.add("ab"[i % 2], str(i)))
+            if i % 50 == 0:
+                await asyncio.sleep(0)
+        await scheduler.close()
+        await dispatcher.close()
+        assert all(future.result() for future in futures)
+        return delivered
+
+    delivered = asyncio.run(run())
+    assert delivered["a"] == list(range(0, 1000, 2))
+    assert delivered["b"] == list(range(1, 1000, 2))
+
+
+def test_failed_delivery_resolves_the_batch_and_the_key_goes_on():
+    async def run() -> tuple[list[bool], list[str]]:
+        delivered = []
+
+        async def handle(batch) -> bool:
+            if batch.lines == ["bad"]:
+                raise RuntimeError("boom")
+            delivered.extend(batch.lines)
+            return True
+
+        dispatcher = Dispatcher(handle)
+        scheduler = FlushScheduler(dispatcher.submit, max_size=1)
+        futures = [scheduler.add("k", line) for line in ("1", "bad", "2")]
+        await scheduler.close()
+        await dispatcher.close()
+        return [future.result() for future in futures], delivered
+
+    assert asyncio.run(run()) == ([True, False, True], ["1", "2"])
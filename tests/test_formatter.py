@@ -0,0 +1,75 @@
+import pytest
+
+from byfoxlib import Formatter
+
+
+class Player:
+    name = "nameless tee"
+    scores = [7, {"best": 12.5}]
+
+
+VALUES = [
+    ["", "nameless tee", "gg wp"],
+    ["1", "привет", "\U0001F600 100%", Player()],
+    [0, 42, 3.14159, Player()]
+]
+
+PATTERNS = [
+    "",
+    "plain text",
+    "{0[1]}",
+    "{0[1]}: {0[2]}",
+    "[{0[0]}] {0[1]}: {0[2]}",
+    "{}",
+    "{0}",
+    "{0[-1]}",
+    "{0[1]!r}",
+    "{0[1]!s} {0[2]!a}",
+    "{0[1]:>20}|{0[2]:<8}|",
+    "{0[1]!r:^30}",
+    "{0[2]:.3}",
+    "{0[3].name}",
+    "{0[3].scores[0]:05d}",
+    "{0[3].scores[1][best]:.1f}",
+    "{0[3].__class__.__name__}",
+    "100% {0[1]} %s %d %%",
+    "{{literal}} {0[1]} {{0}}",
+    "{0[1]}{0[2]}{0[1]}"
+]
+
+REJECTED = [
+    "{1}",
+    "{} {}",
+    "{0} {}",
+    "{} {0}",
+    "{name}",
+    "{0!z}",
+    "{0[1]:>{0}}",
+    "{0.}",
+    "{0[1]",
+    "}"
+]
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_formats_like_str_format(pattern):
+    formatter = Formatter(pattern)
+    for value in VALUES:
+        try:
+            expected = pattern.format(value)
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
+            with pytest.raises(type(e)):
+                formatter.format(value)
+        else:
+            assert formatter.format(value) == expected
+
+
+@pytest.mark.parametrize("pattern", REJECTED)
+def test_rejects_patterns_it_cannot_format(pattern):
+    with pytest.raises(ValueError):
+        Formatter(pattern)
+
+
+def test_joins_values_without_a_pattern():
+    assert Formatter(None).format(["nameless tee", "gg wp"]) == "nameless tee: gg wp"
+    assert Formatter("{0[0]}").many([["a"], ["b"]]) == ["a", "b"]